@@ -1,8 +1,4 @@
 import os
-import librosa
-import numpy as np
-import soundfile as sf
-from music21 import stream, note, instrument, scale
 
 """
 SATB Generator
@@ -13,35 +9,37 @@ Turn your MP3 audio into SATB (Soprano, Alto, Tenor, Bass) sheet music with solf
 Usage:
   python3 SATB_generator.py song1.mp3 song2.mp3 --format musicxml --output-dir results --solfege movable
   python3 SATB_generator.py song1.mp3 --format pdf --output-dir results
+  python3 SATB_generator.py song1.mp3 --quality fast
+  python3 SATB_generator.py library/*.mp3 --jobs 4 --output-dir results
 
 Features:
 - Converts audio to SATB scores (MusicXML, MIDI, PDF)
 - Adds solfège syllables (fixed or movable do)
-- Detects key for movable do
+- Detects major/minor keys for movable do (optionally from an excerpt, --key-excerpt)
+- Caches the audio analysis, so re-exporting a song skips the DSP
 - Tries to guess note durations
-- Batch processing (multiple files)
+- Batch processing (multiple files), optionally in parallel (--jobs)
+- Writes the score and per-voice files in parallel (--export-jobs)
+- Quality tiers (fast / balanced / accurate) trading accuracy for speed
+- Streaming mode with flat memory use for long recordings (--stream)
 - Plays MIDI if you want (needs pygame)
 """
 
-# Fixed do solfège (C major)
-NOTE_TO_SOLFEGE_FIXED = {
-    'C': 'Do', 'C#': 'Di', 'D': 'Re', 'D#': 'Ri', 'E': 'Mi', 'F': 'Fa',
-    'F#': 'Fi', 'G': 'Sol', 'G#': 'Si', 'A': 'La', 'A#': 'Li', 'B': 'Ti'
+# Analysis settings per quality tier: sample rate (None = native), FFT size,
+# hop length and HPSS median kernel (None = no HPSS). See README for timings.
+QUALITY_TIERS = {
+    'fast': {'sr': 22050, 'n_fft': 1024, 'hop_length': 512, 'hpss_kernel': None},
+    'balanced': {'sr': 22050, 'n_fft': 1024, 'hop_length': 256, 'hpss_kernel': 31},
+    'accurate': {'sr': None, 'n_fft': 2048, 'hop_length': 512, 'hpss_kernel': 31},
 }
 
-# Movable do (major scale degrees)
-DEGREE_TO_SOLFEGE = ['Do', 'Re', 'Mi', 'Fa', 'Sol', 'La', 'Ti']
-
-def get_solfege_movable(note_obj, tonic):
-    """Return movable do solfège for a note, given the tonic."""
-    s = scale.MajorScale(tonic)
-    try:
-        deg = s.getScaleDegreeFromPitch(note_obj)
-        if deg is not None and 1 <= deg <= 7:
-            return DEGREE_TO_SOLFEGE[deg-1]
-    except Exception:
-        pass
-    return ''
+def __getattr__(name):
+    # extract_pitch_candidates lives in spectral_frontend; it stays importable
+    # from here, resolved on first use so importing this module stays light
+    if name == 'extract_pitch_candidates':
+        from spectral_frontend import extract_pitch_candidates
+        return extract_pitch_candidates
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def play_midi_file(midi_path):
     """Play a MIDI file if pygame is installed."""
@@ -62,121 +60,266 @@ def play_midi_file(midi_path):
     except Exception as e:
         print(f"Couldn't play MIDI: {e}")
 
-def generate_satb_parts(mp3_file_paths, output_dir=None, output_format="musicxml", export_audio=True, solfege_system='fixed', play_midi=False):
+def transcribe_satb(mp3_file_path, solfege_system='fixed', streaming=False, quality='accurate', use_cache=True, cache=None, key_excerpt=None, progress=None):
+    """
+    Transcribe one audio file into the SATB note-event table.
+
+    Args:
+        mp3_file_path (str): Path to the audio file
+        solfege_system (str): 'fixed' or 'movable' do for the syllables
+        streaming (bool): Analyse in blocks with bounded memory
+        quality (str): Analysis tier, a key of QUALITY_TIERS
+        use_cache (bool): Reuse/store the analysis in the on-disk cache
+        cache (AnalysisCache): Cache to use instead of the default one
+        key_excerpt (float): Detect the key from this many seconds in the
+            middle of the track instead of the whole track
+        progress (callable): Called with (stage, fraction) as the analysis
+            moves through 'decode', 'onset', 'hpss', 'pitch' and 'assignment'
+
+    Returns:
+        np.ndarray: Note events with note_events.NOTE_EVENT_DTYPE, one row per
+        voice per onset, voice-major
+    """
+    # Scientific stack is imported on first use so importing this module
+    # (e.g. from the web apps) stays fast
+    import librosa
+    import numpy as np
+    import soundfile as sf
+    import solfege
+    from spectral_frontend import SpectralFrontEnd, StreamingFrontEnd, extract_pitch_candidates
+    from analysis_cache import AnalysisCache
+    from note_events import assign_voices
+    from key_detection import detect_key, note_histogram
+    tier = QUALITY_TIERS[quality]
+    if cache is None and use_cache:
+        cache = AnalysisCache()
+    cache_params = {'tier': tier, 'streaming': streaming}
+    if key_excerpt:
+        cache_params['key_excerpt'] = key_excerpt
+
+    def report(stage, fraction=0.0):
+        if progress:
+            progress(stage, fraction)
+
+    def key_frames(sr):
+        return int(key_excerpt * sr / tier['hop_length']) if key_excerpt else None
+
+    # Onsets, pitch candidates and chroma only depend on the audio and the
+    # analysis settings, so a repeat with new solfege/format skips the DSP
+    cached = None
+    if cache is not None:
+        cache_key = cache.key(mp3_file_path, cache_params)
+        cached = cache.get(cache_key)
+    # Chroma is only used for movable-do key detection, but a cache entry
+    # must hold it for later runs that do need it
+    need_chroma = solfege_system == 'movable' or cache is not None
+    if cached is not None:
+        print("Using cached analysis...")
+        onset_times, candidates, chroma = cached['onset_times'], cached['candidates'], cached['chroma']
+    elif streaming:
+        print("Analyzing audio...")
+        report('decode')
+        info = sf.info(mp3_file_path)
+        # Only one block of samples and spectra is held at a time;
+        # onsets arrive as each block is analysed
+        frontend = StreamingFrontEnd(
+            mp3_file_path, **tier, chroma_max_frames=key_frames(tier['sr'] or info.samplerate), chroma=need_chroma
+        )
+        # Decoding, HPSS and pitch tracking happen block by block, so the
+        # whole pass reports as onset detection through the track
+        onset_times, rows = [], []
+        for frame, onset_candidates in frontend.iter_onsets():
+            onset_times.append(frontend.frames_to_time(frame))
+            rows.append(onset_candidates)
+            report('onset', min(1.0, onset_times[-1] / info.duration) if info.duration else 0.0)
+        onset_times = np.array(onset_times, dtype=np.float64)
+        candidates = np.array(rows, dtype=np.int8).reshape(-1, 4)
+        chroma = frontend.chroma_profile() if need_chroma else None
+    else:
+        print("Analyzing audio...")
+        report('decode')
+        y, sr = librosa.load(mp3_file_path, sr=tier['sr'])
+        # One STFT feeds onset detection, HPSS, pitch tracking and chroma
+        frontend = SpectralFrontEnd(
+            y, sr, n_fft=tier['n_fft'], hop_length=tier['hop_length'], hpss_kernel=tier['hpss_kernel']
+        )
+        del y
+        report('onset')
+        onset_frames = frontend.onset_frames()
+        report('hpss')
+        harmonic = frontend.harmonic
+        report('pitch')
+        pitches, mags = frontend.piptrack(harmonic)
+        # Candidate pitches for every onset frame at once
+        candidates = extract_pitch_candidates(pitches, mags, onset_frames)
+        del pitches, mags
+        onset_times = frontend.frames_to_time(onset_frames)
+        chroma = frontend.chroma_profile(key_frames(sr)) if need_chroma else None
+    if cached is None and cache is not None:
+        cache.put(cache_key, onset_times, candidates, chroma)
+    report('assignment')
+    events = assign_voices(onset_times, candidates)
+    tonic, mode = 0, 'major'
+    if solfege_system == 'movable':
+        # Silent or unpitched audio has no chroma; fall back to the transcribed notes
+        key = detect_key(chroma if chroma.any() else note_histogram(events))
+        tonic, mode = key.tonic, key.mode
+        print(f"Detected key: {key.name} (confidence {key.confidence:.2f})")
+    # Syllables only depend on the pitch class, so every note is labelled in one lookup
+    events['syllable'] = solfege.label(events['midi'], solfege_system, tonic, mode)
+    return events
+
+def _init_batch_worker(threads):
+    """Cap BLAS/OpenMP threads in a batch worker so the pool doesn't oversubscribe cores."""
+    for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMBA_NUM_THREADS'):
+        os.environ[var] = str(threads)
+    try:
+        # numpy is already loaded by the time this runs, so limit its pools directly
+        from threadpoolctl import threadpool_limits
+        global _worker_thread_limits
+        _worker_thread_limits = threadpool_limits(limits=threads)
+    except ImportError:
+        pass
+
+def _generate_one(mp3_file_path, options):
+    if options.get('return_events'):
+        outputs, events = generate_satb_parts(mp3_file_path, **options)
+        return outputs.get(mp3_file_path, {}), events.get(mp3_file_path)
+    return generate_satb_parts(mp3_file_path, **options).get(mp3_file_path, {})
+
+def iter_satb_parts(mp3_file_paths, jobs=None, **options):
+    """
+    Generate SATB parts for several files in a process pool.
+
+    Args:
+        mp3_file_paths (list): Paths to the audio files
+        jobs (int): Number of worker processes (default: one per core)
+        **options: Keyword arguments passed on to generate_satb_parts
+
+    Yields:
+        tuple: (path, output_files, error) as each file finishes; error is
+        None on success and output_files is {} on failure
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    cpus = os.cpu_count() or 1
+    jobs = min(jobs or cpus, len(mp3_file_paths))
+    threads = max(1, cpus // jobs)
+    # spawn keeps numba/BLAS state from leaking out of the parent
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_batch_worker, initargs=(threads,)) as pool:
+        futures = {pool.submit(_generate_one, path, options): path for path in mp3_file_paths}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], {}, e
+
+def generate_satb_parts(mp3_file_paths, output_dir=None, output_format="musicxml", export_audio=True, solfege_system='fixed', play_midi=False, streaming=False, quality='accurate', jobs=1, use_cache=True, export_jobs=None, return_events=False, key_excerpt=None, progress=None, on_file=None, name_suffix=''):
+    """
+    Generate SATB score files for each input; with return_events, also return {path: note-event table}.
+
+    Output files are named after the input plus ``name_suffix``, so callers
+    that keep results for several settings of one input can keep them apart.
+
+    progress(stage, fraction) follows transcribe_satb's stages, then 'export';
+    on_file(key, path) is called as each output file is written. Neither is
+    called for inputs processed in parallel (jobs != 1).
+    """
     if isinstance(mp3_file_paths, str):
         mp3_file_paths = [mp3_file_paths]
     # Remove non-existent files from the list
     mp3_file_paths = [f for f in mp3_file_paths if os.path.exists(f)]
     if not mp3_file_paths:
         print("No valid input files found. Exiting.")
-        return {}
+        return ({}, {}) if return_events else {}
+    if jobs != 1 and len(mp3_file_paths) > 1:
+        options = dict(output_dir=output_dir, output_format=output_format, export_audio=export_audio,
+                       solfege_system=solfege_system, streaming=streaming, quality=quality, use_cache=use_cache,
+                       export_jobs=1,  # files already run in parallel, so each worker exports inline
+                       return_events=return_events, key_excerpt=key_excerpt, name_suffix=name_suffix)
+        finished = {}
+        all_events = {}
+        for path, output_files, error in iter_satb_parts(mp3_file_paths, jobs, **options):
+            if error is not None:
+                print(f"Failed on {path}: {type(error).__name__}: {error}")
+                continue
+            if return_events:
+                output_files, all_events[path] = output_files
+            print(f"Finished {path} ({len(finished) + 1}/{len(mp3_file_paths)})")
+            finished[path] = output_files
+            if play_midi and 'score_midi' in output_files:
+                play_midi_file(output_files['score_midi'])
+        # Same shape and order as the sequential run; failed files are left out
+        finished = {path: finished[path] for path in mp3_file_paths if path in finished}
+        if return_events:
+            return finished, {path: all_events[path] for path in finished}
+        return finished
+    from analysis_cache import AnalysisCache
+    from score_export import export_files
+    from note_events import VOICES, voice_events
+    cache = AnalysisCache() if use_cache else None
     all_outputs = {}
+    all_events = {}
     for mp3_file_path in mp3_file_paths:
         out_dir = output_dir or os.path.dirname(mp3_file_path)
         os.makedirs(out_dir, exist_ok=True)
         print(f"Working on {mp3_file_path}...")
-        y, sr = librosa.load(mp3_file_path, sr=None)
-        print("Analyzing audio...")
-        onset_frames = librosa.onset.onset_detect(y=y, sr=sr)
-        onset_times = librosa.frames_to_time(onset_frames, sr=sr)
-        y_harmonic = librosa.effects.harmonic(y)
-        pitches, mags = librosa.piptrack(y=y_harmonic, sr=sr)
-        vocal_ranges = {
-            "soprano": (60, 83),
-            "alto": (53, 76),
-            "tenor": (48, 69),
-            "bass": (36, 60)
-        }
-        parts = {v: stream.Part(id=v) for v in vocal_ranges}
-        parts["soprano"].append(instrument.Soprano())
-        parts["alto"].append(instrument.Alto())
-        parts["tenor"].append(instrument.Tenor())
-        parts["bass"].append(instrument.Bass())
-        # Key for movable do
-        detected_key = 'C'
-        if solfege_system == 'movable':
-            chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
-            key_index = chroma.sum(axis=1).argmax()
-            key_names = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-            detected_key = key_names[key_index]
-        # Guess durations
-        if len(onset_times) > 1:
-            durations = np.diff(onset_times)
-            durations = np.append(durations, durations[-1])
-        else:
-            durations = [1.0] * len(onset_times)
-        for i, onset in enumerate(onset_times):
-            if i < len(onset_frames):
-                frame = onset_frames[i]
-                if frame < pitches.shape[1]:
-                    pitch_candidates = []
-                    for freq_bin in range(pitches.shape[0]):
-                        if mags[freq_bin, frame] > 0.1:
-                            midi_pitch = int(round(librosa.hz_to_midi(pitches[freq_bin, frame])))
-                            if 36 <= midi_pitch <= 83:
-                                pitch_candidates.append((midi_pitch, mags[freq_bin, frame]))
-                    pitch_candidates.sort(key=lambda x: x[1], reverse=True)
-                    top_pitches = [p[0] for p in pitch_candidates[:4]]
-                    assigned = {v: None for v in vocal_ranges}
-                    for midi_pitch in sorted(top_pitches, reverse=True):
-                        for v in ["soprano", "alto", "tenor", "bass"]:
-                            if assigned[v] is None and vocal_ranges[v][0] <= midi_pitch <= vocal_ranges[v][1]:
-                                assigned[v] = midi_pitch
-                                break
-                    for v, midi_pitch in assigned.items():
-                        if midi_pitch is not None:
-                            n = note.Note(midi_pitch)
-                            n.quarterLength = float(durations[i])
-                            if solfege_system == 'fixed':
-                                n.lyric = NOTE_TO_SOLFEGE_FIXED.get(n.name, '')
-                            else:
-                                n.lyric = get_solfege_movable(n, detected_key)
-                            parts[v].append(n)
-                        else:
-                            parts[v].append(note.Rest(quarterLength=float(durations[i])))
-        score = stream.Score()
-        for v in ["soprano", "alto", "tenor", "bass"]:
-            score.append(parts[v])
-        base = os.path.splitext(os.path.basename(mp3_file_path))[0]
-        output_files = {}
+        events = transcribe_satb(mp3_file_path, solfege_system, streaming, quality, cache=cache,
+                                 key_excerpt=key_excerpt, progress=progress)
+        # Tasks get the table rows for their voices; music21 objects are only
+        # built by the MusicXML writers
+        parts = [(v, voice_events(events, v)) for v in VOICES]
+        base = os.path.splitext(os.path.basename(mp3_file_path))[0] + name_suffix
+        # One task per output file: (output key, path, format, event rows)
         midi_path = os.path.join(out_dir, f"{base}_satb.mid")
-        score.write('midi', fp=midi_path)
-        output_files['score_midi'] = midi_path
-        for v in ["soprano", "alto", "tenor", "bass"]:
-            part_midi = os.path.join(out_dir, f"{base}_{v}.mid")
-            parts[v].write('midi', fp=part_midi)
-            output_files[f"{v}_midi"] = part_midi
+        tasks = [('score_midi', midi_path, 'midi', events)]
+        tasks += [(f"{v}_midi", os.path.join(out_dir, f"{base}_{v}.mid"), 'midi', rows) for v, rows in parts]
+        xml_path = os.path.join(out_dir, f"{base}_satb.musicxml")
+        musescore_exec = None
         if output_format == "musicxml":
-            xml_path = os.path.join(out_dir, f"{base}_satb.musicxml")
-            score.write('musicxml', fp=xml_path)
-            output_files['score'] = xml_path
-            for v in ["soprano", "alto", "tenor", "bass"]:
-                part_xml = os.path.join(out_dir, f"{base}_{v}.musicxml")
-                parts[v].write('musicxml', fp=part_xml)
-                output_files[v] = part_xml
-        elif output_format == "midi":
+            tasks.append(('score', xml_path, 'musicxml', events))
+            tasks += [(v, os.path.join(out_dir, f"{base}_{v}.musicxml"), 'musicxml', rows) for v, rows in parts]
+        elif output_format == "pdf":
+            musescore_paths = [
+                '/Applications/MuseScore 4.app/Contents/MacOS/mscore',
+                '/Applications/MuseScore 3.app/Contents/MacOS/mscore',
+                '/usr/bin/mscore', '/usr/local/bin/mscore',
+                '/usr/bin/musescore', '/usr/local/bin/musescore'
+            ]
+            musescore_exec = next((p for p in musescore_paths if os.path.exists(p)), None)
+            if musescore_exec:
+                tasks.append(('score_xml', xml_path, 'musicxml', events))
+        written = []
+
+        def file_written(key, path):
+            written.append(key)
+            if progress:
+                progress('export', len(written) / len(tasks))
+            if on_file and key != 'score_xml':
+                on_file(key, path)
+        if progress:
+            progress('export', 0.0)
+        output_files = export_files(tasks, export_jobs, on_file=file_written)
+        if output_format == "midi":
             output_files['score'] = midi_path
+            if on_file:
+                on_file('score', midi_path)
         elif output_format == "pdf":
             pdf_path = os.path.join(out_dir, f"{base}_satb.pdf")
-            try:
-                musescore_paths = [
-                    '/Applications/MuseScore 4.app/Contents/MacOS/mscore',
-                    '/Applications/MuseScore 3.app/Contents/MacOS/mscore',
-                    '/usr/bin/mscore', '/usr/local/bin/mscore',
-                    '/usr/bin/musescore', '/usr/local/bin/musescore'
-                ]
-                musescore_exec = next((p for p in musescore_paths if os.path.exists(p)), None)
-                if musescore_exec:
-                    xml_path = os.path.join(out_dir, f"{base}_satb.musicxml")
-                    score.write('musicxml', fp=xml_path)
+            if musescore_exec:
+                try:
                     os.system(f'"{musescore_exec}" "{xml_path}" -o "{pdf_path}"')
                     output_files['score'] = pdf_path
                     print(f"PDF exported: {pdf_path}")
-                else:
-                    print("MuseScore not found. Please install MuseScore and add it to your PATH for PDF export.")
-                    print("Or open the MusicXML in MuseScore or LilyPond to make a PDF.")
-            except Exception as e:
-                print(f"PDF export failed: {e}")
+                    if on_file:
+                        on_file('score', pdf_path)
+                except Exception as e:
+                    print(f"PDF export failed: {e}")
+                del output_files['score_xml']
+            else:
+                print("MuseScore not found. Please install MuseScore and add it to your PATH for PDF export.")
+                print("Or open the MusicXML in MuseScore or LilyPond to make a PDF.")
         if export_audio:
             print("To turn MIDI into audio, try:")
             print("  fluidsynth -F output.wav soundfont.sf2 input.mid")
@@ -186,12 +329,17 @@ def generate_satb_parts(mp3_file_paths, output_dir=None, output_format="musicxml
             play_midi_file(midi_path)
         print(f"Done! Results in {out_dir}\n")
         all_outputs[mp3_file_path] = output_files
+        all_events[mp3_file_path] = events
+    if return_events:
+        return all_outputs, all_events
     return all_outputs
 
 def convert_mp3_to_wav(mp3_path, wav_path=None):
     if not os.path.exists(mp3_path):
         print(f"File not found: {mp3_path}")
         return None
+    import librosa
+    import soundfile as sf
     wav_path = wav_path or f"{os.path.splitext(mp3_path)[0]}.wav"
     y, sr = librosa.load(mp3_path, sr=None)
     sf.write(wav_path, y, sr)
@@ -206,6 +354,12 @@ if __name__ == "__main__":
     parser.add_argument('--no-audio', action='store_true', help='Skip audio export')
     parser.add_argument('--solfege', choices=['fixed', 'movable'], default='fixed', help='Solfege system')
     parser.add_argument('--play-midi', action='store_true', help='Play the MIDI file (needs pygame)')
+    parser.add_argument('--stream', action='store_true', help='Analyse in blocks with bounded memory (long recordings)')
+    parser.add_argument('--quality', choices=list(QUALITY_TIERS), default='accurate', help='Analysis quality tier')
+    parser.add_argument('--no-cache', action='store_true', help='Always re-run the audio analysis')
+    parser.add_argument('--jobs', type=int, default=1, help='Process files in parallel with N workers (0 = one per core)')
+    parser.add_argument('--key-excerpt', type=float, help='Detect the key from N seconds in the middle of the track')
+    parser.add_argument('--export-jobs', type=int, default=0, help='Write output files with N workers (0 = SATB_EXPORT_WORKERS, default up to 4)')
     args = parser.parse_args()
     output_files = generate_satb_parts(
         args.input_files, 
@@ -213,7 +367,13 @@ if __name__ == "__main__":
         output_format=args.format,
         export_audio=not args.no_audio,
         solfege_system=args.solfege,
-        play_midi=args.play_midi
+        play_midi=args.play_midi,
+        streaming=args.stream,
+        quality=args.quality,
+        jobs=args.jobs or None,
+        use_cache=not args.no_cache,
+        export_jobs=args.export_jobs or None,
+        key_excerpt=args.key_excerpt
     )
     print("All done!")
     for file, outputs in output_files.items():
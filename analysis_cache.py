@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+# Bump when the analysis output changes so stale entries are never reused
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'SATB_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'satb_analysis')
+)
+DEFAULT_MAX_BYTES = int(os.environ.get('SATB_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """
+    On-disk cache of audio analysis results.
+
+    Entries are keyed by the audio content hash plus the analysis parameters
+    and hold the onset times, per-onset pitch candidates and the chroma
+    profile the key is detected from, as an uncompressed ``.npz``. Reads
+    refresh an entry's mtime; writes evict the least recently used entries
+    once the directory grows past ``max_bytes``.
+
+    Args:
+        cache_dir (str): Directory for cache entries
+        max_bytes (int): Size cap for the whole directory
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, audio_path, params):
+        """Cache key for an audio file analysed with ``params`` (a JSON-able dict)."""
+        params = json.dumps({'version': CACHE_VERSION, **params}, sort_keys=True)
+        params_hash = hashlib.sha256(params.encode()).hexdigest()
+        return f"{file_hash(audio_path)[:32]}-{params_hash[:16]}"
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key):
+        """
+        Look up an entry.
+
+        Returns:
+            dict: 'onset_times', 'candidates' and 'chroma' arrays, or None on a miss
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                entry = {name: data[name] for name in data.files}
+        except (OSError, ValueError):
+            return None
+        # Mark as recently used for LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key, onset_times, candidates, chroma):
+        """Store an entry, then evict old entries if the cache is over its size cap."""
+        # Write to a temp file and rename, so concurrent readers never see half an entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, onset_times=np.asarray(onset_times, dtype=np.float64),
+                         candidates=np.asarray(candidates, dtype=np.int8), chroma=np.asarray(chroma, dtype=np.float64))
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"Couldn't write analysis cache entry: {e}")
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npz'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
@@ -1,16 +1,18 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response
 import os
 import json
 from werkzeug.utils import secure_filename
-from SATB_generator import generate_satb_parts
-from audio_converter import convert_musicxml_to_audio
+from SATB_generator import generate_satb_parts, QUALITY_TIERS
+from audio_converter import convert_parts_to_audio
+from job_queue import JobQueue, QueueFull
+from upload_store import save_upload
+from file_serving import send_result
 
 # Import functions used in main.py
-from get_acces_token import get_access_token
-from audio_recorder import record_audio
-from url_extractor import url_extractor
+from get_acces_token import get_token_provider
+from audio_recorder import record_and_upload
 from transciber import transcriber
-from spotify_query import search_track
+from spotify_query import search_track, query_variants
 
 app = Flask(__name__, 
     static_folder='static',
@@ -53,53 +55,121 @@ def upload_file():
     if not file.filename.lower().endswith('.mp3'):
         return jsonify({'error': 'Only MP3 files are supported'}), 400
     
+    quality = request.form.get('quality', 'accurate')
+    if quality not in QUALITY_TIERS:
+        return jsonify({'error': f"Unknown quality '{quality}'"}), 400
+    
     if file:
         filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
+        # Hashed while it streams to disk; a repeat upload reuses the stored copy
+        digest, file_path = save_upload(file, app.config['UPLOAD_FOLDER'], filename)
         
+        # Transcription and audio rendering take minutes, so they run as a
+        # background job; the client polls /jobs/<id> for the result. The same
+        # recording at the same quality attaches to the running job, or gets
+        # the finished result straight away
         try:
-            # Generate MusicXML for SATB parts
-            result_files = generate_satb_parts(
-                file_path, 
-                output_dir=app.config['RESULTS_FOLDER'], 
-                output_format='musicxml',
-                export_audio=True
-            )
-            
-            # Convert MusicXML to audio files
-            audio_files = {}
-            for part, xml_path in result_files.items():
-                if part.endswith('_midi'):
-                    continue
-                
-                try:
-                    if xml_path.endswith('.musicxml'):
-                        audio_path = convert_musicxml_to_audio(
-                            xml_path, 
-                            os.path.join(app.config['AUDIO_FOLDER'], f"{os.path.splitext(os.path.basename(xml_path))[0]}.mp3"),
-                            'mp3'
-                        )
-                        audio_files[f"{part}_audio"] = os.path.basename(audio_path)
-                except Exception as e:
-                    print(f"Error converting {part} to audio: {e}")
-            
-            # Add audio files to result
-            result_files.update(audio_files)
-            
-            # Create response with file paths
-            return jsonify({
-                'message': 'File processed successfully',
-                'files': result_files,
-                'basename': os.path.splitext(filename)[0],
-                'type': 'satb_parts'
-            })
-            
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
+            job_id = jobs.submit('satb_upload', dedup_key=f"{digest}:{quality}", reusable=upload_outputs_exist,
+                                 file_path=file_path, filename=filename, quality=quality)
+        except QueueFull:
+            return jsonify({'error': 'Server busy, please try again shortly'}), 503
+        
+        job = jobs.status(job_id)
+        if job['status'] == 'done':
+            return jsonify({**job['result'], 'job_id': job_id, 'status': 'done'})
+        
+        return jsonify({
+            'message': 'File queued for processing',
+            'job_id': job_id,
+            'status_url': f"/jobs/{job_id}",
+            'events_url': f"/jobs/{job_id}/events",
+            'type': 'job'
+        }), 202
     
     return jsonify({'error': 'File processing failed'}), 500
 
+# Job stages in order, weighted by their share of a typical 'accurate' run
+# (a 3.6 min song: decode 4 s, HPSS 11 s, pitch tracking 2 s, ...)
+UPLOAD_STAGES = {'decode': 4, 'onset': 0.5, 'hpss': 10, 'pitch': 2, 'assignment': 0.5, 'export': 2, 'audio': 8}
+
+def upload_outputs_exist(result):
+    """Whether a finished /upload job's files are all still on disk."""
+    return all(
+        os.path.exists(path if os.path.isabs(path) else os.path.join(app.config['AUDIO_FOLDER'], path))
+        for path in result['files'].values()
+    )
+
+def process_upload(job, file_path, filename, quality):
+    """Job handler for /upload: SATB parts, then an audio file per part."""
+    from note_events import VOICES
+
+    # Generate MusicXML for SATB parts; each file is announced as soon as it is written
+    outputs = generate_satb_parts(
+        file_path, 
+        output_dir=app.config['RESULTS_FOLDER'], 
+        output_format='musicxml',
+        export_audio=True,
+        quality=quality,
+        progress=job.progress,
+        on_file=job.add_file,
+        # One set of files per dedup key, so a run at another quality cannot
+        # overwrite the files a finished job's result points to
+        name_suffix=f"_{quality}"
+    )
+    if file_path not in outputs:
+        raise RuntimeError(f"No SATB parts were generated for {filename}")
+    result_files = outputs[file_path]
+    
+    # Render audio from the MIDI files written with the MusicXML: each voice is
+    # synthesized once and the full score is their mix, so the voices can be
+    # played while the mix is still being written
+    audio_path = lambda midi_path: os.path.join(
+        app.config['AUDIO_FOLDER'], f"{os.path.splitext(os.path.basename(midi_path))[0]}.mp3")
+    parts = {
+        part: (result_files[f"{part}_midi"], audio_path(result_files[f"{part}_midi"]))
+        for part in VOICES if f"{part}_midi" in result_files
+    }
+    audio_files = {}
+    job.progress('audio', 0.0)
+    
+    def audio_written(part, path):
+        audio_files[f"{part}_audio"] = os.path.basename(path)
+        job.add_file(f"{part}_audio", os.path.basename(path))
+        job.progress('audio', len(audio_files) / (len(parts) + 1))
+    
+    if parts and 'score_midi' in result_files:
+        try:
+            convert_parts_to_audio(parts, result_files['score_midi'], audio_path(result_files['score_midi']),
+                                   'mp3', on_file=audio_written)
+        except Exception as e:
+            print(f"Error converting parts to audio: {e}")
+    
+    # Add audio files to result
+    result_files.update(audio_files)
+    
+    return {
+        'message': 'File processed successfully',
+        'files': result_files,
+        'basename': os.path.splitext(filename)[0],
+        'type': 'satb_parts'
+    }
+
+jobs = JobQueue()
+jobs.register('satb_upload', process_upload, stages=tuple(UPLOAD_STAGES), weights=UPLOAD_STAGES)
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = jobs.status(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    # Server-Sent Events: stage progress with percentage and ETA, and each output file as it is written
+    return Response(jobs.events(job_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/record', methods=['POST'])
 def record():
     try:
@@ -111,17 +181,15 @@ def record():
         timestamp = int(time.time())
         filename = os.path.join(app.config['RECORDINGS_FOLDER'], f"recording_{timestamp}.wav")
         
-        # Record audio
-        audio_path = record_audio(filename, int(duration))
-        
-        # Process recorded audio - this follows the flow in main.py
-        audio_url = url_extractor(audio_path)
+        # Record audio, uploading it while recording - this follows the flow in main.py
+        audio_path, audio_url = record_and_upload(filename, int(duration))
         music_text = transcriber(audio_url)
         
         print(f"Transcription: {music_text}")
         
-        # Get Spotify access token
-        access_token = get_access_token(client_id, client_secret)
+        # Cached process-wide; only refreshed shortly before it expires
+        token_provider = get_token_provider(client_id, client_secret)
+        access_token = token_provider.get_token()
         
         if not access_token:
             print("Failed to get Spotify access token")
@@ -135,7 +203,10 @@ def record():
         
         # Search for tracks - making sure it returns results instead of just printing them
         try:
-            tracks = search_track(music_text, access_token, limit=3, return_results=True)
+            # The whole transcript plus shorter excerpts, searched concurrently, since
+            # a noisy transcript often only matches on part of the phrase
+            tracks = search_track(query_variants(music_text or ''), access_token, limit=3, return_results=True,
+                                  token_provider=token_provider)
             
             # If tracks is None or not a list, handle it gracefully
             if not tracks or not isinstance(tracks, list):
@@ -161,13 +232,14 @@ def record():
         print(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+# Cacheable, range-capable responses; MusicXML goes out precompressed
 @app.route('/results/<filename>')
 def serve_results(filename):
-    return send_file(os.path.join(app.config['RESULTS_FOLDER'], filename))
+    return send_result(app.config['RESULTS_FOLDER'], filename)
 
 @app.route('/audio/<filename>')
 def serve_audio(filename):
-    return send_file(os.path.join(app.config['AUDIO_FOLDER'], filename))
+    return send_result(app.config['AUDIO_FOLDER'], filename)
 
 @app.route('/recordings/<filename>')
 def serve_recordings(filename):
@@ -26,7 +26,8 @@ def get_access_token(client_id, client_secret):
     token_info = response.json()
     return token_info['access_token']
 
-# Example usage
-access_token = get_access_token(client_id, client_secret)
+if __name__ == "__main__":
+    # Example usage
+    access_token = get_access_token(client_id, client_secret)
 
 
@@ -0,0 +1,185 @@
+import asyncio
+import os
+import threading
+import time
+
+import requests
+
+"""
+Asyncio client for the AssemblyAI upload -> submit -> poll flow.
+
+HTTP calls run on worker threads (asyncio.to_thread) with a shared
+requests session, and waiting between polls is an asyncio sleep, so many
+transcriptions can be in flight on one event loop without holding a
+thread each. Polling starts fast and backs off exponentially, resetting
+whenever the job changes state, so short clips come back within a fraction
+of a second of completing.
+"""
+
+API_BASE = os.getenv('ASSEMBLYAI_BASE_URL', 'https://api.assemblyai.com/v2')
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+
+class TranscriptionError(Exception):
+    """AssemblyAI rejected a request or a transcript finished with an error."""
+
+
+class AssemblyAIClient:
+    """
+    Async AssemblyAI client.
+
+    Args:
+        api_key (str): AssemblyAI API key (default: the API_KEY env var)
+        base_url (str): API root, overridable for a local fake server
+        max_concurrency (int): HTTP requests in flight at once, across all
+            event loops and threads using this client
+        poll_initial (float): First poll delay, in seconds
+        poll_max (float): Longest poll delay, in seconds
+        poll_factor (float): Delay growth per poll while the status is unchanged
+        timeout (float): Give up on a transcript after this many seconds
+    """
+
+    def __init__(self, api_key=None, base_url=API_BASE, max_concurrency=8,
+                 poll_initial=0.25, poll_max=5.0, poll_factor=1.6, timeout=900):
+        self.api_key = api_key or os.getenv('API_KEY')
+        self.base_url = base_url.rstrip('/')
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self.poll_factor = poll_factor
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self._session = requests.Session()
+        self._session.headers['authorization'] = self.api_key or ''
+        # A thread semaphore rather than an asyncio one: the sync wrappers run a
+        # new event loop per call on each Flask request thread, and the limit
+        # has to hold across all of them
+        self._limit = threading.BoundedSemaphore(max_concurrency)
+
+    def _send(self, method, url, **kwargs):
+        # Runs on a worker thread, so waiting for a slot never blocks an event loop
+        with self._limit:
+            return self._session.request(method, url, timeout=30, **kwargs)
+
+    async def _request(self, method, path, **kwargs):
+        return await asyncio.to_thread(self._send, method, f"{self.base_url}{path}", **kwargs)
+
+    async def upload(self, audio, chunk_size=UPLOAD_CHUNK_SIZE):
+        """
+        Upload audio and return its AssemblyAI URL.
+
+        Args:
+            audio (str or iterable): Path to an audio file, or an iterable
+                of byte chunks streamed as the request body
+            chunk_size (int): Read size when streaming a file
+
+        Returns:
+            str: upload_url for submit()
+        """
+        if isinstance(audio, (str, os.PathLike)):
+            with open(audio, 'rb') as f:
+                response = await self._request('POST', '/upload', data=iter(lambda: f.read(chunk_size), b''))
+        else:
+            response = await self._request('POST', '/upload', data=audio)
+        if response.status_code != 200:
+            raise TranscriptionError(f"Upload failed: {response.status_code} {response.text}")
+        return response.json()['upload_url']
+
+    async def submit(self, audio_url, **options):
+        """Start a transcript for an uploaded (or public) audio URL and return its ID."""
+        response = await self._request('POST', '/transcript', json={'audio_url': audio_url, **options})
+        if response.status_code != 200:
+            raise TranscriptionError(f"Transcription request failed: {response.text}")
+        return response.json()['id']
+
+    async def wait(self, transcript_id, on_status=None):
+        """
+        Poll a transcript until it completes.
+
+        Args:
+            transcript_id (str): ID from submit()
+            on_status (callable): Called with each new status
+
+        Returns:
+            dict: The completed transcript
+
+        Raises:
+            TranscriptionError: If the transcript fails or times out
+        """
+        deadline = time.monotonic() + self.timeout
+        delay = self.poll_initial
+        status = None
+        while True:
+            response = await self._request('GET', f'/transcript/{transcript_id}')
+            if response.status_code != 200:
+                raise TranscriptionError(f"Polling failed: {response.status_code} {response.text}")
+            transcript = response.json()
+            if transcript['status'] != status:
+                status = transcript['status']
+                # Back to fast polling whenever the job moves on (queued -> processing)
+                delay = self.poll_initial
+                if on_status:
+                    on_status(status)
+            if status == 'completed':
+                return transcript
+            if status == 'error':
+                raise TranscriptionError(transcript.get('error', 'Transcription failed'))
+            if time.monotonic() + delay > deadline:
+                raise TranscriptionError(f"Transcript {transcript_id} timed out after {self.timeout}s")
+            await asyncio.sleep(delay)
+            delay = min(self.poll_max, delay * self.poll_factor)
+
+    async def transcribe_url(self, audio_url, on_status=None, **options):
+        """Submit and wait; returns the transcript text."""
+        transcript_id = await self.submit(audio_url, **options)
+        transcript = await self.wait(transcript_id, on_status)
+        return transcript['text']
+
+    async def transcribe(self, audio, on_status=None, **options):
+        """Upload, submit and wait; returns the transcript text."""
+        return await self.transcribe_url(await self.upload(audio), on_status, **options)
+
+    async def transcribe_many(self, audio_items, **options):
+        """
+        Transcribe several files concurrently.
+
+        Returns:
+            list: Transcript text or the raised exception, in input order
+        """
+        return await asyncio.gather(
+            *(self.transcribe(audio, **options) for audio in audio_items), return_exceptions=True
+        )
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_client():
+    """Shared client for the sync wrappers."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = AssemblyAIClient()
+        return _default_client
+
+
+def run_sync(coro):
+    """Run a coroutine to completion from sync code, even if this thread already runs a loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    # Called from inside an event loop: run on a separate thread with its own loop
+    result = {}
+
+    def runner():
+        try:
+            result['value'] = asyncio.run(coro)
+        except BaseException as e:
+            result['error'] = e
+    thread = threading.Thread(target=runner)
+    thread.start()
+    thread.join()
+    if 'error' in result:
+        raise result['error']
+    return result['value']
@@ -1,7 +1,8 @@
+import functools
 import os
 import subprocess
+import sys
 import tempfile
-from music21 import converter
 
 def convert_musicxml_to_midi(musicxml_file, midi_file=None):
     """
@@ -17,6 +18,8 @@ def convert_musicxml_to_midi(musicxml_file, midi_file=None):
     if midi_file is None:
         midi_file = os.path.splitext(musicxml_file)[0] + '.mid'
     
+    from music21 import converter
+
     # Load the MusicXML file with music21
     score = converter.parse(musicxml_file)
     
@@ -41,54 +44,278 @@ def convert_midi_to_audio(midi_file, audio_file=None, format='wav', soundfont=No
     if audio_file is None:
         audio_file = os.path.splitext(midi_file)[0] + f'.{format}'
     
-    # Default soundfont paths to try
-    soundfont_paths = [
-        soundfont,
-        '/usr/share/sounds/sf2/FluidR3_GM.sf2',
-        '/usr/share/soundfonts/FluidR3_GM.sf2',
-        '/usr/share/sounds/sf2/default.sf2'
-    ]
+    try:
+        from midi_renderer import get_renderer
+        renderer = get_renderer(soundfont)
+    except ImportError:
+        # No pyfluidsynth / FluidSynth library: run the fluidsynth command line
+        renderer = None
     
-    # Find the first available soundfont
-    sf_path = None
-    for path in soundfont_paths:
-        if path and os.path.exists(path):
-            sf_path = path
-            break
+    if renderer is not None:
+        # Rendered in memory by the resident synth (soundfont already loaded)
+        return _write_blocks(renderer.render_blocks(midi_file), audio_file, format, renderer.sample_rate)
     
-    if not sf_path:
-        # If no soundfont is found, download a free soundfont
-        sf_path = download_soundfont()
+    sf_path = find_soundfont(soundfont)
     
     # Convert MIDI to audio using FluidSynth
     if format.lower() == 'wav':
         cmd = ['fluidsynth', '-ni', '-g', '1', sf_path, midi_file, '-F', audio_file]
     else:  # mp3
-        # FluidSynth can't output MP3 directly, so we create a WAV first
-        temp_wav = tempfile.NamedTemporaryFile(suffix='.wav', delete=False).name
-        cmd_wav = ['fluidsynth', '-ni', '-g', '1', sf_path, midi_file, '-F', temp_wav]
+        return _fluidsynth_to_mp3(sf_path, midi_file, audio_file)
+    
+    try:
+        subprocess.run(cmd, check=True)
+        return audio_file
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Error converting MIDI to audio: {e}")
+
+def convert_parts_to_audio(parts, score_midi, score_audio, format='mp3', soundfont=None, on_file=None):
+    """
+    Render SATB voices and their mix, synthesizing every voice only once
+    
+    With the resident renderer every voice has its own synth, and all of
+    them render in lockstep, one block at a time, to the same length. Each
+    block goes to its stem's encoder and is added into the mix's, so only
+    one block per voice is held in memory and the mix is encoded alongside
+    the stems. Without it, each voice and the score are rendered by the
+    fluidsynth command line.
+    
+    Args:
+        parts (dict): Key -> (voice MIDI path, output audio path)
+        score_midi (str): MIDI file with all the voices (only rendered without the resident renderer)
+        score_audio (str): Output path for the mix
+        format (str): Output format (wav or mp3)
+        soundfont (str): Path to soundfont file
+        on_file (callable): Called as on_file(key, audio path) when each file is written;
+            the mix is reported as 'score'
         
+    Returns:
+        dict: Key -> audio path, with the mix under 'score'
+    """
+    try:
+        from midi_renderer import get_renderer, read_midi
+        renderers = [get_renderer(soundfont, slot) for slot in range(len(parts))]
+    except ImportError:
+        renderers = None
+    
+    written = {}
+    def done(key, path):
+        written[key] = path
+        if on_file:
+            on_file(key, path)
+    
+    if renderers is None:
+        for key, (midi_file, audio_file) in parts.items():
+            done(key, convert_midi_to_audio(midi_file, audio_file, format, soundfont))
+        done('score', convert_midi_to_audio(score_midi, score_audio, format, soundfont))
+        return written
+    
+    import numpy as np
+    from midi_renderer import BLOCK_FRAMES, SAMPLE_RATE
+    
+    # Stems share one length so they line up when played together
+    events = {key: read_midi(midi_file) for key, (midi_file, _) in parts.items()}
+    frames = max((renderer.length(e) for renderer, e in zip(renderers, events.values())), default=0)
+    sample_rate = renderers[0].sample_rate if renderers else SAMPLE_RATE
+    stems = {key: renderer.render_events(events[key], frames) for renderer, key in zip(renderers, parts)}
+    
+    writers = {}
+    try:
+        for key, (_, audio_file) in parts.items():
+            writers[key] = _AudioWriter(audio_file, format, sample_rate)
+        writers['score'] = _AudioWriter(score_audio, format, sample_rate)
+        # Block n of every stem covers the same frames
+        for blocks in zip(*(_regroup(stem, BLOCK_FRAMES) for stem in stems.values())):
+            mix = np.zeros(blocks[0].shape, dtype=np.int32)
+            for key, block in zip(stems, blocks):
+                writers[key].write(block)
+                mix += block
+            np.clip(mix, -32768, 32767, out=mix)
+            writers['score'].write(mix.astype(np.int16))
+    except BaseException:
+        for writer in writers.values():
+            writer.abort()
+        raise
+    finally:
+        # Releases each synth if rendering stopped early
+        for stem in stems.values():
+            stem.close()
+    
+    for key, writer in list(writers.items()):
         try:
-            subprocess.run(cmd_wav, check=True)
-            
-            # Convert WAV to MP3 using FFmpeg
-            cmd = ['ffmpeg', '-i', temp_wav, '-q:a', '2', audio_file]
-            subprocess.run(cmd, check=True)
-            
-            # Remove temporary WAV file
-            os.unlink(temp_wav)
+            path = writer.close()
+        except BaseException:
+            for other in writers.values():
+                if other is not writer and other.open:
+                    other.abort()
+            raise
+        done(key, path)
+    return written
+
+def _regroup(blocks, size):
+    """Re-cut (frames, 2) blocks into blocks of exactly ``size`` frames (the last may be shorter)."""
+    import numpy as np
+    
+    pending, have = [], 0
+    for block in blocks:
+        while len(block):
+            take = min(size - have, len(block))
+            pending.append(block[:take])
+            have += take
+            block = block[take:]
+            if have == size:
+                yield pending[0] if len(pending) == 1 else np.concatenate(pending)
+                pending, have = [], 0
+    if have:
+        yield np.concatenate(pending)
+
+class _AudioWriter:
+    """
+    Incremental WAV or MP3 output for (frames, 2) int16 blocks
+    
+    WAV files are written with soundfile; MP3 blocks are piped into FFmpeg,
+    which encodes them while the next ones are rendered.
+    """
+    
+    def __init__(self, audio_file, format, sample_rate):
+        self.audio_file = audio_file
+        self.open = True
+        self._wav = self._encoder = None
+        if format.lower() == 'wav':
+            import soundfile as sf
+            self._wav = sf.SoundFile(audio_file, 'w', sample_rate, 2, subtype='PCM_16')
+        else:
+            self._encoder = _mp3_encoder(audio_file, sample_rate)
+    
+    def write(self, block):
+        if self._wav is not None:
+            self._wav.write(block)
+            return
+        try:
+            self._encoder.stdin.write(block.astype('<i2', copy=False).tobytes())
+        except BrokenPipeError:
+            pass  # FFmpeg exited early; its return code says why
+    
+    def close(self):
+        """Finish the file and return its path."""
+        self.open = False
+        if self._wav is not None:
+            self._wav.close()
+            return self.audio_file
+        try:
+            self._encoder.stdin.close()
+        except BrokenPipeError:
+            pass
+        return _finish_mp3(self._encoder, self.audio_file)
+    
+    def abort(self):
+        """Stop writing and delete the partial file."""
+        self.open = False
+        if self._wav is not None:
+            self._wav.close()
+        else:
+            self._encoder.kill()
+            self._encoder.wait()
+        _remove(self.audio_file)
+
+def _write_blocks(blocks, audio_file, format, sample_rate):
+    """Write (frames, 2) int16 blocks to a WAV or MP3 file."""
+    writer = _AudioWriter(audio_file, format, sample_rate)
+    try:
+        for block in blocks:
+            writer.write(block)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.close()
+
+def _mp3_encoder(audio_file, sample_rate, source='pipe:0'):
+    """Start FFmpeg encoding 16-bit little-endian stereo PCM from ``source`` (stdin by default) to MP3."""
+    cmd = ['ffmpeg', '-y', '-f', 's16le', '-ar', str(sample_rate), '-ac', '2', '-i', source, '-q:a', '2', audio_file]
+    return subprocess.Popen(cmd, stdin=subprocess.PIPE if source == 'pipe:0' else subprocess.DEVNULL)
+
+def _finish_mp3(encoder, audio_file):
+    if encoder.wait() != 0:
+        _remove(audio_file)
+        raise RuntimeError(f"Error converting MIDI to MP3: ffmpeg exited with status {encoder.returncode}")
+    return audio_file
+
+def _fluidsynth_to_mp3(sf_path, midi_file, audio_file, sample_rate=44100):
+    """
+    Render with the fluidsynth command line straight into FFmpeg
+    
+    fluidsynth writes raw PCM into a named pipe that FFmpeg reads while it
+    is being rendered, so no WAV is written to disk.
+    """
+    if not hasattr(os, 'mkfifo') or sys.byteorder != 'little':
+        # No named pipes (Windows) or raw output in the wrong byte order: go through a WAV
+        temp_wav = tempfile.NamedTemporaryFile(suffix='.wav', delete=False).name
+        try:
+            subprocess.run(['fluidsynth', '-ni', '-g', '1', sf_path, midi_file, '-F', temp_wav], check=True)
+            return _wav_to_mp3(temp_wav, audio_file)
         except subprocess.CalledProcessError as e:
-            if os.path.exists(temp_wav):
-                os.unlink(temp_wav)
             raise RuntimeError(f"Error converting MIDI to MP3: {e}")
-        
-        return audio_file
+        finally:
+            os.unlink(temp_wav)
     
+    with tempfile.TemporaryDirectory() as pipe_dir:
+        pipe = os.path.join(pipe_dir, 'pcm')
+        os.mkfifo(pipe)
+        encoder = _mp3_encoder(audio_file, sample_rate, pipe)
+        try:
+            cmd = ['fluidsynth', '-ni', '-g', '1', '-r', str(sample_rate), '-T', 'raw', '-O', 's16',
+                   sf_path, midi_file, '-F', pipe]
+            subprocess.run(cmd, check=True)
+        except BaseException as e:
+            # FFmpeg may still be waiting for the pipe to be opened
+            encoder.kill()
+            encoder.wait()
+            _remove(audio_file)
+            if isinstance(e, subprocess.CalledProcessError):
+                raise RuntimeError(f"Error converting MIDI to MP3: {e}")
+            raise
+        return _finish_mp3(encoder, audio_file)
+
+def _wav_to_mp3(wav_file, audio_file):
+    """Encode a WAV file to MP3 with FFmpeg."""
+    cmd = ['ffmpeg', '-y', '-i', wav_file, '-q:a', '2', audio_file]
     try:
         subprocess.run(cmd, check=True)
-        return audio_file
     except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Error converting MIDI to audio: {e}")
+        raise RuntimeError(f"Error converting MIDI to MP3: {e}")
+    return audio_file
+
+def _remove(path):
+    """Delete a partly written output file."""
+    if os.path.exists(path):
+        os.unlink(path)
+
+@functools.lru_cache(maxsize=None)
+def find_soundfont(soundfont=None):
+    """
+    Locate (or download) the soundfont to render with; the result is cached per process
+    
+    Args:
+        soundfont (str): Preferred soundfont path (optional)
+        
+    Returns:
+        str: Path to the soundfont
+    """
+    # Default soundfont paths to try
+    soundfont_paths = [
+        soundfont,
+        '/usr/share/sounds/sf2/FluidR3_GM.sf2',
+        '/usr/share/soundfonts/FluidR3_GM.sf2',
+        '/usr/share/sounds/sf2/default.sf2'
+    ]
+    
+    # Find the first available soundfont
+    for path in soundfont_paths:
+        if path and os.path.exists(path):
+            return path
+    
+    # If no soundfont is found, download a free soundfont
+    return download_soundfont()
 
 def download_soundfont():
     """
@@ -1,20 +1,22 @@
-try:
-    import sounddevice as sd
-    import numpy as np
-    import wave
-    import os
-    import time
-except OSError as e:
-    if 'PortAudio library not found' in str(e):
-        print("Error: PortAudio library not found.")
-        print("Please install the PortAudio development libraries:")
-        print("  For Ubuntu/Debian: sudo apt-get install portaudio19-dev")
-        print("  For macOS: brew install portaudio")
-        print("  For Windows: pip install pipwin && pipwin install pyaudio")
-        print("\nAfter installing the library, reinstall sounddevice: pip install sounddevice")
-        exit(1)
-    else:
+import wave
+import os
+import threading
+import time
+
+def _import_sounddevice():
+    """Import sounddevice on first use, so importing this module never needs PortAudio."""
+    try:
+        import sounddevice as sd
+    except OSError as e:
+        if 'PortAudio library not found' in str(e):
+            print("Error: PortAudio library not found.")
+            print("Please install the PortAudio development libraries:")
+            print("  For Ubuntu/Debian: sudo apt-get install portaudio19-dev")
+            print("  For macOS: brew install portaudio")
+            print("  For Windows: pip install pipwin && pipwin install pyaudio")
+            print("\nAfter installing the library, reinstall sounddevice: pip install sounddevice")
         raise
+    return sd
 
 def record_audio(filename="recording.wav", duration=5, samplerate=44100):
     """
@@ -25,6 +27,7 @@ def record_audio(filename="recording.wav", duration=5, samplerate=44100):
         duration (int): Recording duration in seconds
         samplerate (int): Sample rate in Hz
     """
+    sd = _import_sounddevice()
     print(f"Recording {duration} seconds of audio...")
     
     # Record audio
@@ -50,3 +53,193 @@ def record_audio(filename="recording.wav", duration=5, samplerate=44100):
 
     return os.path.abspath(filename)
 
+
+
+class RingBuffer:
+    """
+    Fixed-size int16 sample FIFO between the audio callback and a consumer.
+
+    write() never blocks, so it is safe to call from the PortAudio callback;
+    if the consumer falls more than ``capacity`` frames behind, the oldest
+    frames are dropped and counted in ``overruns``.
+    """
+
+    def __init__(self, capacity, channels):
+        # numpy is imported where it's used, so importing the web apps doesn't load it
+        import numpy as np
+        self._data = np.zeros((capacity, channels), dtype=np.int16)
+        self._written = 0
+        self._read = 0
+        self._closed = False
+        self._ready = threading.Condition()
+        self.overruns = 0
+
+    def write(self, frames):
+        capacity = len(self._data)
+        skipped = max(0, len(frames) - capacity)
+        frames = frames[skipped:]
+        with self._ready:
+            # Frames that don't fit at all count as written, then dropped below
+            self._written += skipped
+            start = self._written % capacity
+            first = min(len(frames), capacity - start)
+            self._data[start:start + first] = frames[:first]
+            self._data[:len(frames) - first] = frames[first:]
+            self._written += len(frames)
+            if self._written - self._read > capacity:
+                self.overruns += self._written - self._read - capacity
+                self._read = self._written - capacity
+            self._ready.notify()
+
+    def close(self):
+        """No more frames are coming; read() drains what is left, then returns None."""
+        with self._ready:
+            self._closed = True
+            self._ready.notify()
+
+    def read(self, timeout=None):
+        """Every frame written since the last read, waiting for at least one; None once closed and empty."""
+        import numpy as np
+        with self._ready:
+            if not self._ready.wait_for(lambda: self._written > self._read or self._closed, timeout):
+                return np.zeros((0, self._data.shape[1]), dtype=np.int16)
+            if self._written == self._read:
+                return None
+            capacity = len(self._data)
+            indices = np.arange(self._read, self._written) % capacity
+            self._read = self._written
+            return self._data[indices]
+
+
+class FileInputStream:
+    """
+    Stand-in for sounddevice.InputStream that plays an audio file into the
+    callback in real time, for exercising the streaming recorder without a
+    microphone. Pass ``functools.partial(FileInputStream, path)`` as
+    ``input_stream``.
+    """
+
+    def __init__(self, path, samplerate, channels, dtype='int16', blocksize=1024, callback=None):
+        import numpy as np
+        import soundfile as sf
+        audio, file_rate = sf.read(path, dtype=dtype, always_2d=True)
+        if file_rate != samplerate:
+            raise ValueError(f"{path} is {file_rate} Hz, not {samplerate} Hz")
+        self._audio = audio[:, np.arange(channels) % audio.shape[1]]
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self._callback = callback
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        start = time.monotonic()
+        for offset in range(0, len(self._audio), self.blocksize):
+            block = self._audio[offset:offset + self.blocksize]
+            # Deliver each block when it would have been captured
+            delay = start + (offset + len(block)) / self.samplerate - time.monotonic()
+            if self._stop.wait(max(0.0, delay)):
+                return
+            self._callback(block, len(block), None, None)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def close(self):
+        self.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def stream_recording(filename, duration, samplerate=44100, channels=2, input_stream=None):
+    """
+    Record from the microphone, yielding audio while capture is running.
+
+    Blocks come out of a ring buffer filled by the input callback, and are
+    also written to ``filename`` as they arrive, so the WAV is complete as
+    soon as the generator is exhausted.
+
+    Args:
+        filename (str): WAV file to save the recording to
+        duration (float): Recording duration in seconds
+        samplerate (int): Sample rate in Hz
+        channels (int): Number of input channels
+        input_stream (callable): sounddevice.InputStream-compatible factory
+            (default: sounddevice.InputStream; see FileInputStream)
+
+    Yields:
+        np.ndarray: (frames, channels) int16 blocks
+    """
+    if input_stream is None:
+        input_stream = _import_sounddevice().InputStream
+    target = int(duration * samplerate)
+    ring = RingBuffer(capacity=samplerate * 10, channels=channels)
+    captured = 0
+
+    def callback(indata, frames, time_info, status):
+        nonlocal captured
+        if captured >= target:
+            return
+        block = indata[:target - captured]
+        captured += len(block)
+        ring.write(block)
+        if captured >= target:
+            ring.close()
+
+    print(f"Recording {duration} seconds of audio...")
+    with wave.open(filename, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)  # 2 bytes for 'int16'
+        wf.setframerate(samplerate)
+        with input_stream(samplerate=samplerate, channels=channels, dtype='int16', callback=callback):
+            while True:
+                block = ring.read(timeout=duration + 5)
+                if block is None:
+                    break
+                if not len(block):
+                    raise RuntimeError("Audio input stopped delivering samples")
+                wf.writeframes(block.tobytes())
+                yield block
+
+    print("Recording finished!")
+    if ring.overruns:
+        print(f"Warning: dropped {ring.overruns} frames the consumer couldn't keep up with")
+    print(f"Audio saved as {filename}")
+
+
+def record_and_upload(filename="recording.wav", duration=5, samplerate=44100, input_stream=None):
+    """
+    Record audio and upload it to AssemblyAI at the same time.
+
+    The capture is encoded to 16 kHz mono Ogg/Opus and sent as a chunked
+    upload while recording, so the upload completes right after the last
+    sample instead of starting then.
+
+    Args:
+        filename (str): Name of the output file
+        duration (int): Recording duration in seconds
+        samplerate (int): Sample rate in Hz
+        input_stream (callable): See stream_recording()
+
+    Returns:
+        tuple: (absolute path of the WAV, upload_url for transcriber())
+    """
+    from assemblyai_client import get_client, run_sync
+    from speech_encoder import encode_blocks
+
+    blocks = stream_recording(filename, duration, samplerate, input_stream=input_stream)
+    # Small chunks so encoded audio leaves as soon as libsndfile writes an Ogg page
+    body = encode_blocks(blocks, samplerate, 'opus', chunk_size=4096)
+    audio_url = run_sync(get_client().upload(body))
+    print(f"File saved at: {os.path.abspath(filename)}")
+    return os.path.abspath(filename), audio_url
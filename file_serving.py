@@ -0,0 +1,65 @@
+import mimetypes
+import os
+
+from flask import abort, request, send_file
+from werkzeug.security import safe_join
+
+from precompress import ENCODINGS, PRECOMPRESSED_EXTENSIONS
+
+"""
+Serving generated scores and audio.
+
+Responses carry Last-Modified and ETag validators (revalidation gets a 304)
+and a long max-age, and support Range requests so the audio player can
+seek without fetching the whole MP3 again. For MusicXML, the .br/.gz copy
+written at export is sent as-is when the client accepts that encoding.
+"""
+
+mimetypes.add_type('application/vnd.recordare.musicxml+xml', '.musicxml')
+
+# Results are rewritten when a song is regenerated under the same name, so
+# caches keep them for a day and then revalidate against the ETag
+CACHE_MAX_AGE = int(os.getenv('SATB_CACHE_MAX_AGE', str(24 * 3600)))
+
+
+def _precompressed(path):
+    """(encoding, sibling path) for the best accepted, up-to-date compressed copy, or None."""
+    if not path.endswith(PRECOMPRESSED_EXTENSIONS):
+        return None
+    mtime = os.path.getmtime(path)
+    for encoding, suffix in ENCODINGS:
+        sibling = path + suffix
+        if request.accept_encodings[encoding] and os.path.exists(sibling) and os.path.getmtime(sibling) >= mtime:
+            return encoding, sibling
+    return None
+
+
+def send_result(folder, filename, as_attachment=False, max_age=CACHE_MAX_AGE):
+    """
+    Send a generated file with caching headers, range support and precompression.
+
+    Args:
+        folder (str): Directory the file must be inside
+        filename (str): Path relative to ``folder`` (from the URL)
+        as_attachment (bool): Send as a download
+        max_age (int): Seconds clients may cache without revalidating
+
+    Returns:
+        flask.Response
+    """
+    path = safe_join(folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    # Relative folders are relative to the working directory, as when the files were written
+    path = os.path.abspath(path)
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    compressed = _precompressed(path)
+    if compressed:
+        encoding, path = compressed
+    response = send_file(path, mimetype=mimetype, as_attachment=as_attachment,
+                         download_name=os.path.basename(filename), conditional=True, etag=True, max_age=max_age)
+    if compressed:
+        response.headers['Content-Encoding'] = encoding
+    if filename.endswith(PRECOMPRESSED_EXTENSIONS):
+        response.vary.add('Accept-Encoding')
+    return response
@@ -1,9 +1,18 @@
 import requests
 import base64
+import threading
+import time
 
+TOKEN_URL = 'https://accounts.spotify.com/api/token'
 
-def get_access_token(client_id, client_secret):
-    url = 'https://accounts.spotify.com/api/token'
+
+def request_access_token(client_id, client_secret, url=TOKEN_URL):
+    """
+    Request a client-credentials token from Spotify.
+
+    Returns:
+        tuple: (access_token, expires_in seconds), or None on failure
+    """
     auth_header = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
 
     headers = {
@@ -14,15 +23,93 @@ def get_access_token(client_id, client_secret):
         'grant_type': 'client_credentials'
     }
 
-    response = requests.post(url, headers=headers, data=data)
+    response = requests.post(url, headers=headers, data=data, timeout=10)
 
     if response.status_code != 200:
         print("Failed to get token:", response.status_code, response.text)
         return None
 
     token_info = response.json()
-    return token_info['access_token']
+    return token_info['access_token'], token_info.get('expires_in', 3600)
+
+
+def get_access_token(client_id, client_secret):
+    token = request_access_token(client_id, client_secret)
+    return token[0] if token else None
+
+
+class SpotifyTokenProvider:
+    """
+    Process-wide cache for a client-credentials token.
+
+    The token is reused until ``refresh_margin`` seconds before it expires.
+    Only one thread refreshes at a time; threads that ask while a refresh is
+    in flight wait for it and get the new token instead of requesting their
+    own. If a refresh fails, a token that has not actually expired yet is
+    still handed out.
+
+    Args:
+        client_id (str): Spotify client ID
+        client_secret (str): Spotify client secret
+        refresh_margin (float): Seconds before expiry to refresh
+        url (str): Token endpoint
+    """
+
+    def __init__(self, client_id, client_secret, refresh_margin=60, url=TOKEN_URL):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_margin = refresh_margin
+        self.url = url
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def _fresh(self):
+        return self._token is not None and time.monotonic() < self._expires_at - self.refresh_margin
+
+    def get_token(self):
+        """Cached access token, refreshed when close to expiry; None if none can be had."""
+        if self._fresh():
+            return self._token
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            if self._fresh():
+                return self._token
+            try:
+                token = request_access_token(self.client_id, self.client_secret, self.url)
+            except requests.RequestException as e:
+                print(f"Failed to get token: {e}")
+                token = None
+            if token is not None:
+                self._token, expires_in = token
+                self._expires_at = time.monotonic() + expires_in
+            elif time.monotonic() >= self._expires_at:
+                self._token = None
+            return self._token
+
+    def invalidate(self, token=None):
+        """
+        Drop the cached token, e.g. after the API rejects it with a 401.
+
+        Args:
+            token (str): The rejected token; if given, the cache is only
+                dropped while it still holds that token, so concurrent
+                requests that all got a 401 don't discard a refreshed one
+        """
+        with self._lock:
+            if token is None or token == self._token:
+                self._token = None
+                self._expires_at = 0.0
 
 
+_providers = {}
+_providers_lock = threading.Lock()
 
 
+def get_token_provider(client_id, client_secret):
+    """Shared SpotifyTokenProvider for a set of credentials."""
+    with _providers_lock:
+        provider = _providers.get((client_id, client_secret))
+        if provider is None:
+            provider = _providers[(client_id, client_secret)] = SpotifyTokenProvider(client_id, client_secret)
+        return provider
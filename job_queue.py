@@ -0,0 +1,460 @@
+import json
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+"""
+Background jobs for the web apps.
+
+Long requests (transcription, export, audio rendering) are submitted to a
+JobQueue and run on a small thread pool; the endpoint returns a job id
+straight away and clients poll /jobs/<id>, or follow /jobs/<id>/events, a
+Server-Sent Events stream of stage progress (with an overall percentage
+and ETA) and of output files as they are written. Every job is a row in a
+SQLite database, so its status, per-stage state and result outlive the
+process. Several processes (e.g. gunicorn workers) can share the
+database: each job is owned by the queue that runs it, which renews a
+lease on it every few seconds. Only jobs whose lease has run out - their
+process stopped or died - are claimed and started again by another queue.
+"""
+
+JOBS_DB = os.getenv('SATB_JOBS_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jobs.db'))
+JOB_WORKERS = int(os.getenv('SATB_JOB_WORKERS', '2'))
+MAX_PENDING_JOBS = int(os.getenv('SATB_MAX_PENDING_JOBS', '16'))
+# Seconds a queue's claim on its jobs lasts without being renewed; renewed every third of that
+JOB_LEASE = float(os.getenv('SATB_JOB_LEASE', '60'))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+PENDING = 'pending'
+SKIPPED = 'skipped'
+
+# Fractional progress is written and published at most this often per job
+PROGRESS_INTERVAL = 0.5
+
+
+class QueueFull(Exception):
+    """Too many jobs are already waiting; the client should retry later."""
+
+
+class JobStore:
+    """
+    SQLite-backed job records.
+
+    Args:
+        path (str): Database file (default: jobs.db next to this module,
+            or SATB_JOBS_DB)
+    """
+
+    _JSON_FIELDS = ('params', 'stages', 'result')
+
+    def __init__(self, path=JOBS_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL,"
+            " params TEXT NOT NULL, stages TEXT NOT NULL, result TEXT, error TEXT,"
+            " created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        # Databases created before jobs could be deduplicated lack the key
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if 'dedup_key' not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN dedup_key TEXT")
+        # Older databases lack owners and leases too; their unfinished jobs count as expired
+        for column, kind in (('owner', 'TEXT'), ('lease', 'REAL')):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (kind, dedup_key)")
+
+    def _decode(self, row):
+        job = dict(row)
+        for field in self._JSON_FIELDS:
+            if job[field] is not None:
+                job[field] = json.loads(job[field])
+        return job
+
+    def create(self, kind, params, stages, dedup_key=None, owner=None, lease=None):
+        now = time.time()
+        job = {
+            'id': uuid.uuid4().hex, 'kind': kind, 'status': QUEUED, 'params': params,
+            'stages': {name: {'state': PENDING} for name in stages},
+            'result': None, 'error': None, 'created': now, 'updated': now, 'dedup_key': dedup_key,
+            'owner': owner, 'lease': lease,
+        }
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(job)}) VALUES ({', '.join(':' + k for k in job)})",
+                {**job, **{f: json.dumps(job[f]) for f in self._JSON_FIELDS}},
+            )
+        return job
+
+    def find(self, kind, dedup_key):
+        """Newest job of this kind and key that hasn't failed, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE kind = ? AND dedup_key = ? AND status != ? ORDER BY created DESC LIMIT 1",
+                (kind, dedup_key, FAILED),
+            ).fetchone()
+        return self._decode(row) if row else None
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._decode(row) if row else None
+
+    def update(self, job_id, **fields):
+        fields['updated'] = time.time()
+        values = {k: json.dumps(v) if k in self._JSON_FIELDS else v for k, v in fields.items()}
+        assignments = ", ".join(f"{k} = :{k}" for k in values)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = :id", {**values, 'id': job_id})
+
+    def unfinished(self, kinds, expired_before=None):
+        """Jobs of the given kinds that are queued or running, oldest first; with
+        ``expired_before``, only those whose lease ran out before that time."""
+        marks = ", ".join("?" * len(kinds))
+        query = f"SELECT * FROM jobs WHERE status IN (?, ?) AND kind IN ({marks})"
+        args = [QUEUED, RUNNING, *kinds]
+        if expired_before is not None:
+            query += " AND (lease IS NULL OR lease < ?)"
+            args.append(expired_before)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY created", args).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def renew(self, owner, lease):
+        """Extend the lease on every unfinished job held by ``owner``."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease = ? WHERE owner = ? AND status IN (?, ?)", (lease, owner, QUEUED, RUNNING)
+            )
+
+    def claim(self, job_id, previous_owner, owner, lease, now, stages):
+        """
+        Take over an unfinished job whose lease expired, resetting it to queued.
+
+        The check and the update are one statement, so when several processes
+        try to reclaim the same job only one of them gets it.
+
+        Returns:
+            bool: Whether this caller now owns the job
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET owner = ?, lease = ?, status = ?, stages = ?, updated = ?"
+                " WHERE id = ? AND owner IS ? AND status IN (?, ?) AND (lease IS NULL OR lease < ?)",
+                (owner, lease, QUEUED, json.dumps(stages), now, job_id, previous_owner, QUEUED, RUNNING, now),
+            )
+        return cursor.rowcount == 1
+
+
+def job_progress(stages, weights, now=None):
+    """
+    Overall completion and estimated seconds left for a job's stages.
+
+    Stages count by weight: done and skipped ones fully, a running one by
+    its reported fraction. The ETA extrapolates the time since the first
+    stage started; it is None until there is something to extrapolate.
+
+    Returns:
+        tuple: (fraction 0..1, eta seconds or None)
+    """
+    total = sum(weights.get(name, 1.0) for name in stages) or 1.0
+    complete = 0.0
+    for name, stage in stages.items():
+        if stage['state'] in (DONE, SKIPPED):
+            complete += weights.get(name, 1.0)
+        elif stage['state'] == RUNNING:
+            complete += weights.get(name, 1.0) * stage.get('progress', 0.0)
+    fraction = complete / total
+    started = [stage['started'] for stage in stages.values() if 'started' in stage]
+    if not started or fraction < 0.01 or fraction >= 1.0:
+        return fraction, (0.0 if fraction >= 1.0 else None)
+    elapsed = (now or time.time()) - min(started)
+    return fraction, elapsed * (1.0 - fraction) / fraction
+
+
+class Job:
+    """Handle passed to job handlers for reporting progress."""
+
+    def __init__(self, queue, record):
+        self._queue = queue
+        self.id = record['id']
+        self.params = record['params']
+        self.stages = record['stages']
+        self.files = {}
+        self._saved = 0.0
+
+    def set_stage(self, name, state, save=True, **info):
+        stage = self.stages.setdefault(name, {})
+        stage.update(info, state=state)
+        if state == RUNNING:
+            stage['started'] = time.time()
+            stage['progress'] = stage.get('progress', 0.0)
+        elif state in (DONE, FAILED):
+            stage['finished'] = time.time()
+            if state == DONE:
+                stage['progress'] = 1.0
+        if save:
+            self._save()
+
+    def progress(self, name, fraction=0.0):
+        """
+        Report progress through a stage; use as a pipeline progress callback.
+
+        Moving to a new stage finishes the running one, and stages listed
+        before it that never ran are marked skipped (e.g. analysis stages
+        when the analysis came from the cache).
+        """
+        stage = self.stages.get(name)
+        if stage is None or stage['state'] != RUNNING:
+            names = list(self.stages)
+            for other in names[:names.index(name)] if stage is not None else names:
+                if self.stages[other]['state'] == RUNNING:
+                    self.set_stage(other, DONE, save=False)
+                elif self.stages[other]['state'] == PENDING and stage is not None:
+                    self.set_stage(other, SKIPPED, save=False)
+            self.set_stage(name, RUNNING, progress=fraction)
+            return
+        stage['progress'] = fraction
+        if time.monotonic() - self._saved >= PROGRESS_INTERVAL:
+            self._save()
+
+    def finish_stages(self):
+        """Mark whatever is still running as done."""
+        for name, stage in self.stages.items():
+            if stage['state'] == RUNNING:
+                self.set_stage(name, DONE)
+
+    def add_file(self, key, path):
+        """Record an output file as soon as it exists; clients get a 'file' event."""
+        self.files[key] = path
+        self._queue.store.update(self.id, result={'files': self.files})
+        self._queue.publish(self.id, 'file', {'key': key, 'path': path})
+
+    def _save(self):
+        self._saved = time.monotonic()
+        self._queue.store.update(self.id, stages=self.stages)
+        self._queue.publish(self.id, 'progress', self._queue.progress_view(self.id, self.stages))
+
+    @contextmanager
+    def stage(self, name):
+        """Mark a stage running for the duration of the block, then done (or failed)."""
+        self.set_stage(name, RUNNING)
+        try:
+            yield
+        except BaseException:
+            self.set_stage(name, FAILED)
+            raise
+        self.set_stage(name, DONE)
+
+
+class JobQueue:
+    """
+    Bounded thread pool running registered job kinds.
+
+    Args:
+        store (JobStore): Where jobs are recorded (default: a JobStore on JOBS_DB)
+        workers (int): Jobs run at once
+        max_pending (int): Jobs allowed to wait or run before submit() raises QueueFull
+        lease (float): Seconds this queue's claim on a job lasts unless renewed
+    """
+
+    def __init__(self, store=None, workers=JOB_WORKERS, max_pending=MAX_PENDING_JOBS, lease=JOB_LEASE):
+        self.store = store or JobStore()
+        self.max_pending = max_pending
+        self.lease = lease
+        # Unique per queue, not just per process, so two queues never share jobs
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers = {}
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='satb-job')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._recovered = False
+        self._listeners = {}
+        self._kinds = {}
+
+    def register(self, kind, handler, stages=(), weights=None):
+        """
+        Args:
+            kind (str): Job type name stored with each job
+            handler (callable): handler(job, **params) -> JSON-serialisable result
+            stages (tuple): Stage names, in order, reported as pending until
+                the handler reaches them
+            weights (dict): Relative duration of each stage, for the overall
+                percentage and ETA (default: 1 each)
+        """
+        self._handlers[kind] = (handler, tuple(stages), dict(weights or {}))
+
+    def submit(self, kind, dedup_key=None, reusable=None, **params):
+        """
+        Queue a job and return its id; params must be JSON-serialisable.
+
+        With ``dedup_key`` (e.g. an upload's content hash plus the settings),
+        a queued or running job of the same kind and key is returned instead
+        of starting another, and so is a finished one unless
+        ``reusable(result)`` says its outputs are gone.
+        """
+        self._recover()
+        with self._lock:
+            if dedup_key is not None:
+                existing = self.store.find(kind, dedup_key)
+                if existing and (existing['status'] != DONE or reusable is None or reusable(existing['result'])):
+                    return existing['id']
+            if self._pending >= self.max_pending:
+                raise QueueFull(f"{self._pending} jobs already pending")
+            self._pending += 1
+            job = self.store.create(kind, params, self._handlers[kind][1], dedup_key,
+                                    owner=self.owner, lease=time.time() + self.lease)
+        self._kinds[job['id']] = kind
+        self._pool.submit(self._run, job)
+        return job['id']
+
+    def status(self, job_id):
+        """Public view of a job, or None if there is no such job."""
+        self._recover()
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        job.pop('params')
+        for internal in ('dedup_key', 'owner', 'lease'):
+            job.pop(internal, None)
+        weights = self._handlers.get(job['kind'], (None, (), {}))[2]
+        job['progress'], job['eta'] = job_progress(job['stages'], weights)
+        return job
+
+    def progress_view(self, job_id, stages):
+        """Payload of a 'progress' event: the stages plus overall progress and ETA."""
+        kind = self._kinds.get(job_id)
+        weights = self._handlers[kind][2] if kind in self._handlers else {}
+        fraction, eta = job_progress(stages, weights)
+        running = [name for name, stage in stages.items() if stage['state'] == RUNNING]
+        return {'stage': running[-1] if running else None, 'progress': fraction, 'eta': eta, 'stages': stages}
+
+    def publish(self, job_id, event, data):
+        with self._lock:
+            listeners = list(self._listeners.get(job_id, ()))
+        for listener in listeners:
+            listener.put((event, data))
+
+    def events(self, job_id, keepalive=5.0):
+        """
+        Server-Sent Events for one job, for a text/event-stream response.
+
+        Starts with a 'status' event holding the full job, then 'progress'
+        and 'file' events, and ends with 'done' or 'failed' (the full job
+        again; a failed job has no result, so files announced before the
+        failure must be dropped). Jobs run by another process are followed by re-reading the
+        store every ``keepalive`` seconds.
+
+        Yields:
+            str: Encoded SSE messages
+        """
+        listener = queue.Queue()
+        with self._lock:
+            self._listeners.setdefault(job_id, []).append(listener)
+        try:
+            job = self.status(job_id)
+            if job is None:
+                yield _sse('failed', {'error': 'Unknown job'})
+                return
+            yield _sse('status', job)
+            last_update = job['updated']
+            while job['status'] not in (DONE, FAILED):
+                try:
+                    event, data = listener.get(timeout=keepalive)
+                except queue.Empty:
+                    job = self.status(job_id)
+                    if job['status'] in (DONE, FAILED):
+                        break
+                    if job['updated'] != last_update:
+                        last_update = job['updated']
+                        yield _sse('progress', self.progress_view(job_id, job['stages']))
+                    else:
+                        yield ": keepalive\n\n"
+                    continue
+                if event in (DONE, FAILED):
+                    job = data
+                    break
+                yield _sse(event, data)
+            yield _sse(job['status'], job)
+        finally:
+            with self._lock:
+                self._listeners[job_id].remove(listener)
+                if not self._listeners[job_id]:
+                    del self._listeners[job_id]
+
+    def _recover(self):
+        # Started lazily rather than at import, so e.g. the Flask reloader's
+        # parent process doesn't hold leases or take jobs over
+        with self._lock:
+            if self._recovered:
+                return
+            self._recovered = True
+        self._reclaim()
+        threading.Thread(target=self._heartbeat, name='satb-job-lease', daemon=True).start()
+
+    def _heartbeat(self):
+        """Renew this queue's leases, and pick up jobs of queues that stopped renewing theirs."""
+        while True:
+            time.sleep(self.lease / 3)
+            try:
+                self.store.renew(self.owner, time.time() + self.lease)
+                self._reclaim()
+            except sqlite3.Error as e:
+                print(f"Job lease renewal failed: {e}")
+
+    def _reclaim(self):
+        now = time.time()
+        for job in self.store.unfinished(tuple(self._handlers), expired_before=now):
+            if job['owner'] == self.owner:
+                continue  # still in this queue's pool, just late renewing
+            stages = {name: {'state': PENDING} for name in job['stages']}
+            if not self.store.claim(job['id'], job['owner'], self.owner, now + self.lease, now, stages):
+                continue  # another queue got there first
+            print(f"Restarting job {job['id']} ({job['kind']}, was {job['status']})")
+            job['stages'] = stages
+            with self._lock:
+                self._pending += 1
+            self._kinds[job['id']] = job['kind']
+            self._pool.submit(self._run, job)
+
+    def _run(self, record):
+        handler = self._handlers[record['kind']][0]
+        job = Job(self, record)
+        self.store.update(job.id, status=RUNNING)
+        try:
+            result = handler(job, **job.params)
+            job.finish_stages()
+            self.store.update(job.id, status=DONE, result=result)
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+            print(traceback.format_exc())
+            for name, stage in job.stages.items():
+                if stage['state'] == RUNNING:
+                    job.set_stage(name, FAILED)
+            # A failed export removes what it wrote, so files reported along the way are void
+            self.store.update(job.id, status=FAILED, result=None, error=str(e) or type(e).__name__)
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._kinds.pop(job.id, None)
+            final = self.status(job.id)
+            self.publish(job.id, final['status'], final)
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,96 @@
+from collections import namedtuple
+
+import numpy as np
+
+from solfege import KEY_NAMES, MODES
+from note_events import REST
+
+"""
+Key detection over the 24 major and minor keys.
+
+A 12-bin pitch-class profile (summed STFT chroma, or a duration-weighted
+histogram of transcribed notes) is correlated with the Krumhansl-Kessler
+key profiles rotated to every tonic. Both inputs are already produced by
+the pipeline, so detection itself costs microseconds.
+"""
+
+# Krumhansl & Kessler (1982) probe-tone ratings, tonic first
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+
+def _key_templates():
+    """(24, 12) z-scored templates, rows ordered major C..B then minor C..B."""
+    templates = np.stack([
+        np.roll(profile, tonic) for profile in (MAJOR_PROFILE, MINOR_PROFILE) for tonic in range(12)
+    ])
+    templates -= templates.mean(axis=1, keepdims=True)
+    return templates / np.linalg.norm(templates, axis=1, keepdims=True)
+
+
+KEY_TEMPLATES = _key_templates()
+
+
+class Key(namedtuple('Key', ['tonic', 'mode', 'confidence'])):
+    """Detected key: tonic pitch class (0 = C), 'major'/'minor' and a 0..1 confidence."""
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return f"{KEY_NAMES[self.tonic]} {self.mode}"
+
+
+def key_scores(profile):
+    """
+    Correlation of a pitch-class profile with every key.
+
+    Args:
+        profile (np.ndarray): 12 pitch-class weights, C first
+
+    Returns:
+        np.ndarray: (2, 12) Pearson correlations indexed [mode, tonic]
+    """
+    profile = np.asarray(profile, dtype=np.float64)
+    centered = profile - profile.mean()
+    norm = np.linalg.norm(centered)
+    if norm == 0:
+        return np.zeros((len(MODES), 12))
+    return (KEY_TEMPLATES @ (centered / norm)).reshape(len(MODES), 12)
+
+
+def detect_key(profile):
+    """
+    Most likely key for a pitch-class profile.
+
+    The confidence is how far the best key stands out from the runner-up,
+    (r1 - r2) / (1 - r2) for the two highest correlations: 0 when two keys
+    tie (typically the relative major/minor), 1 for a perfect match. A flat
+    or empty profile gives C major with confidence 0.
+
+    Args:
+        profile (np.ndarray): 12 pitch-class weights, C first
+
+    Returns:
+        Key: (tonic, mode, confidence)
+    """
+    scores = key_scores(profile).ravel()
+    best, second = np.argsort(scores)[::-1][:2]
+    if scores[best] <= 0:
+        return Key(0, 'major', 0.0)
+    confidence = (scores[best] - scores[second]) / (1 - scores[second])
+    return Key(int(best % 12), MODES[best // 12], float(confidence))
+
+
+def note_histogram(events):
+    """
+    Duration-weighted pitch-class histogram of a note-event table.
+
+    Args:
+        events (np.ndarray): Rows with note_events.NOTE_EVENT_DTYPE
+
+    Returns:
+        np.ndarray: 12 weights, C first
+    """
+    sung = events[events['midi'] != REST]
+    return np.bincount(sung['midi'] % 12, weights=sung['duration'], minlength=12)
+
@@ -1,6 +1,5 @@
 from get_acces_token import get_access_token
-from audio_recorder import record_audio
-from url_extractor import url_extractor
+from audio_recorder import record_and_upload
 from transciber import transcriber
 from spotify_query import search_track
 import os
@@ -8,10 +7,10 @@ import os
 client_id = os.getenv('CLIENT_ID')
 client_secret = os.getenv('CLIENT_SECRET')
 
-# Example usage
-access_token = get_access_token(client_id, client_secret)
-
 if __name__ == "__main__":
+    # Fetched here rather than at import, so importing this module never hits the network
+    access_token = get_access_token(client_id, client_secret)
+
     print("Audio Recorder")
     print("--------------")
 
@@ -24,10 +23,9 @@ if __name__ == "__main__":
     print("Press Enter to start recording (Ctrl+C to exit)")
     input()
     
-    audio_path = record_audio(filename, duration)
-
-    audio_url = url_extractor(audio_path)
+    # Uploads while recording, so transcription can start right after the last sample
+    audio_path, audio_url = record_and_upload(filename, duration)
 
     music_text = transcriber(audio_url)
 
-    search_track(music_text,access_token, limit=3)
\ No newline at end of file
+    search_track(music_text or '', access_token, limit=3)
\ No newline at end of file
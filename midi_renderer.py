@@ -0,0 +1,312 @@
+import argparse
+import os
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from audio_converter import find_soundfont
+
+"""
+Resident in-process MIDI synthesizer.
+
+Running the fluidsynth command line for every part means a cold start per
+part: a new process that parses the multi-megabyte SF2 soundfont again.
+MidiRenderer keeps one pyfluidsynth synth per soundfont for the life of
+the process, loads the soundfont once, and renders MIDI files straight
+into int16 PCM arrays. It schedules the file's events itself, driving
+the synth sample-accurately rather than through fluidsynth's real-time
+player. get_renderer() hands out the shared instance, or one per slot
+when several parts are rendered side by side. Rendering holds a lock
+because the job worker threads share the synths.
+"""
+
+SAMPLE_RATE = 44100
+GAIN = 1.0  # same as `fluidsynth -g 1`
+BLOCK_FRAMES = 4096
+RELEASE_TAIL = 1.0  # seconds rendered after the last event so notes can ring out
+DEFAULT_TEMPO = 500000
+
+NOTE_OFF, NOTE_ON, CONTROL_CHANGE, PROGRAM_CHANGE, PITCH_BEND = 0x80, 0x90, 0xB0, 0xC0, 0xE0
+
+_renderers = {}
+_renderers_lock = threading.Lock()
+
+
+def _read_vlq(data, pos):
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, pos
+
+
+def _read_track(data):
+    """(tick, status, data1, data2) channel events and (tick, tempo) changes of one MTrk chunk."""
+    events, tempos = [], []
+    pos, tick, running = 0, 0, None
+    while pos < len(data):
+        delta, pos = _read_vlq(data, pos)
+        tick += delta
+        status = data[pos]
+        if status & 0x80:
+            pos += 1
+        elif running is None:
+            raise ValueError("MIDI data byte without a status byte")
+        else:
+            status = running
+        if status == 0xFF:
+            kind = data[pos]
+            length, pos = _read_vlq(data, pos + 1)
+            if kind == 0x51:
+                tempos.append((tick, int.from_bytes(data[pos:pos + 3], 'big')))
+            elif kind == 0x2F:
+                break
+            pos += length
+        elif status in (0xF0, 0xF7):
+            length, pos = _read_vlq(data, pos)
+            pos += length
+        else:
+            running = status
+            if status & 0xF0 in (0xC0, 0xD0):
+                events.append((tick, status, data[pos], 0))
+                pos += 1
+            else:
+                events.append((tick, status, data[pos], data[pos + 1]))
+                pos += 2
+    return events, tempos
+
+
+def read_midi(midi_file):
+    """
+    Channel events of a Standard MIDI File with their times in seconds.
+
+    Args:
+        midi_file (str): Path to a .mid file (format 0 or 1)
+
+    Returns:
+        list: (seconds, kind, channel, data1, data2) tuples in playing order;
+            note-ons with velocity 0 are reported as NOTE_OFF
+    """
+    with open(midi_file, 'rb') as f:
+        data = f.read()
+    if data[:4] != b'MThd':
+        raise ValueError(f"{midi_file} is not a Standard MIDI File")
+    header_length = struct.unpack('>I', data[4:8])[0]
+    _, ntracks, division = struct.unpack('>HHH', data[8:14])
+    pos = 8 + header_length
+
+    events, tempos = [], []
+    for track in range(ntracks):
+        kind, length = data[pos:pos + 4], struct.unpack('>I', data[pos + 4:pos + 8])[0]
+        pos += 8
+        if kind == b'MTrk':
+            track_events, track_tempos = _read_track(data[pos:pos + length])
+            events += [(tick, track, i, event) for i, (tick, *event) in enumerate(track_events)]
+            tempos += track_tempos
+        pos += length
+    events.sort(key=lambda e: e[:3])
+    tempos.sort()
+
+    # (tick, seconds, seconds per tick) at the start of each tempo segment
+    if division & 0x8000:
+        # SMPTE timing: frames per second and ticks per frame, no tempo map
+        fps = -struct.unpack('b', bytes([division >> 8]))[0]
+        segments = [(0, 0.0, 1.0 / (fps * (division & 0xFF)))]
+    else:
+        segments = [(0, 0.0, DEFAULT_TEMPO / (division * 1e6))]
+        for tick, tempo in tempos:
+            start, seconds, per_tick = segments[-1]
+            segments.append((tick, seconds + (tick - start) * per_tick, tempo / (division * 1e6)))
+
+    timed, segment = [], 0
+    for tick, _, _, (status, data1, data2) in events:
+        # Events are sorted by tick, so the tempo segment only moves forward
+        while segment + 1 < len(segments) and segments[segment + 1][0] <= tick:
+            segment += 1
+        start, seconds, per_tick = segments[segment]
+        kind = status & 0xF0
+        if kind == NOTE_ON and data2 == 0:
+            kind = NOTE_OFF
+        timed.append((seconds + (tick - start) * per_tick, kind, status & 0x0F, data1, data2))
+    return timed
+
+
+class MidiRenderer:
+    """
+    A long-lived fluidsynth synth with one soundfont loaded.
+
+    Args:
+        soundfont (str): Path to an SF2 soundfont (searched for if None)
+        sample_rate (int): Output sample rate in Hz
+        gain (float): Synth master gain
+    """
+
+    def __init__(self, soundfont=None, sample_rate=SAMPLE_RATE, gain=GAIN):
+        # Raises ImportError if pyfluidsynth or the FluidSynth library is missing
+        import fluidsynth
+
+        self.soundfont = find_soundfont(soundfont)
+        self.sample_rate = sample_rate
+        self._synth = fluidsynth.Synth(gain=gain, samplerate=float(sample_rate))
+        self._sfid = self._synth.sfload(self.soundfont)
+        if self._sfid == -1:
+            raise RuntimeError(f"FluidSynth could not load soundfont {self.soundfont}")
+        self._lock = threading.Lock()
+
+    def _dispatch(self, kind, channel, data1, data2):
+        synth = self._synth
+        if kind == NOTE_ON:
+            synth.noteon(channel, data1, data2)
+        elif kind == NOTE_OFF:
+            synth.noteoff(channel, data1)
+        elif kind == CONTROL_CHANGE:
+            synth.cc(channel, data1, data2)
+        elif kind == PROGRAM_CHANGE:
+            synth.program_change(channel, data1)
+        elif kind == PITCH_BEND:
+            synth.pitch_bend(channel, ((data2 << 7) | data1) - 8192)
+
+    def _samples(self, frames):
+        """Advance the synth ``frames`` frames, in blocks of at most BLOCK_FRAMES."""
+        while frames > 0:
+            n = min(frames, BLOCK_FRAMES)
+            yield np.asarray(self._synth.get_samples(n), dtype=np.int16).reshape(-1, 2)
+            frames -= n
+
+    def length(self, events, tail=RELEASE_TAIL):
+        """Frames rendered for ``events``: up to the last event, plus ``tail`` seconds."""
+        last = events[-1][0] if events else 0.0
+        return int(round((last + tail) * self.sample_rate))
+
+    def render_events(self, events, frames):
+        """
+        Render events from read_midi() for exactly ``frames`` frames.
+
+        The synth is held until the last block, so consume the generator
+        promptly (or close it) rather than leaving it half-read.
+
+        Args:
+            events (list): (seconds, kind, channel, data1, data2) tuples in order
+            frames (int): Output length; events after it are not played
+
+        Yields:
+            np.ndarray: (frames, 2) int16 stereo blocks
+        """
+        with self._lock:
+            # Back to the soundfont's default presets with no notes sounding
+            self._synth.system_reset()
+            now = 0
+            for seconds, kind, channel, data1, data2 in events:
+                frame = int(round(seconds * self.sample_rate))
+                if frame >= frames:
+                    break
+                if frame > now:
+                    yield from self._samples(frame - now)
+                    now = frame
+                self._dispatch(kind, channel, data1, data2)
+            yield from self._samples(frames - now)
+
+    def render_blocks(self, midi_file, tail=RELEASE_TAIL):
+        """
+        Render a MIDI file block by block.
+
+        Args:
+            midi_file (str): Path to a .mid file
+            tail (float): Seconds rendered after the last event
+
+        Yields:
+            np.ndarray: (frames, 2) int16 stereo blocks
+        """
+        events = read_midi(midi_file)
+        yield from self.render_events(events, self.length(events, tail))
+
+    def render(self, midi_file, tail=RELEASE_TAIL):
+        """
+        Render a MIDI file into memory.
+
+        Args:
+            midi_file (str): Path to a .mid file
+            tail (float): Seconds rendered after the last event
+
+        Returns:
+            np.ndarray: (frames, 2) int16 stereo PCM at ``sample_rate``
+        """
+        blocks = list(self.render_blocks(midi_file, tail))
+        return np.concatenate(blocks) if blocks else np.zeros((0, 2), dtype=np.int16)
+
+
+def get_renderer(soundfont=None, slot=0):
+    """
+    The process-wide renderer for a soundfont, created on first use.
+
+    One synth renders one file at a time, so callers that render several
+    files in lockstep take one renderer per file from separate slots. Each
+    slot loads its own copy of the soundfont.
+
+    Args:
+        soundfont (str): Soundfont path (searched for if None)
+        slot (int): Which of the soundfont's renderers to return
+
+    Raises:
+        ImportError: pyfluidsynth or the FluidSynth library is not installed
+    """
+    path = find_soundfont(soundfont)
+    with _renderers_lock:
+        if (path, slot) not in _renderers:
+            _renderers[(path, slot)] = MidiRenderer(path)
+        return _renderers[(path, slot)]
+
+
+def benchmark(midi_files, soundfont=None, repeat=3):
+    """
+    Per-part render time with the resident synth vs a fluidsynth process per part.
+
+    Args:
+        midi_files (list): .mid files to render
+        soundfont (str): Soundfont path (searched for if None)
+        repeat (int): Renders of each file per path; the best time is reported
+
+    Returns:
+        dict: file -> {'resident': seconds, 'subprocess': seconds}
+    """
+    sf_path = find_soundfont(soundfont)
+    start = time.perf_counter()
+    renderer = get_renderer(sf_path)
+    print(f"Soundfont loaded once in {time.perf_counter() - start:.3f}s")
+
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        wav = os.path.join(tmp, 'out.wav')
+        for midi_file in midi_files:
+            resident, spawned = [], []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                renderer.render(midi_file)
+                resident.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                subprocess.run(['fluidsynth', '-ni', '-g', '1', sf_path, midi_file, '-F', wav],
+                               check=True, capture_output=True)
+                spawned.append(time.perf_counter() - start)
+            timings[midi_file] = {'resident': min(resident), 'subprocess': min(spawned)}
+            print(f"{os.path.basename(midi_file)}: resident {min(resident):.3f}s, "
+                  f"subprocess {min(spawned):.3f}s ({min(spawned) / min(resident):.1f}x)")
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the resident MIDI renderer against the fluidsynth CLI')
+    parser.add_argument('midi_files', nargs='+', help='MIDI files to render')
+    parser.add_argument('--soundfont', help='SF2 soundfont to use')
+    parser.add_argument('--repeat', type=int, default=3, help='Renders per file and path (best is reported)')
+    args = parser.parse_args()
+    benchmark(args.midi_files, args.soundfont, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
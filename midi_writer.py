@@ -0,0 +1,90 @@
+import struct
+
+"""
+Minimal Standard MIDI File writer for SATB note events.
+
+Writes the same layout music21 produces for our scores (format 1,
+10080 ticks per quarter, a conductor track with tempo and 4/4, one track
+per voice with a name, program change and lyric meta events), without
+building music21 streams first.
+"""
+
+TICKS_PER_QUARTER = 10080
+DEFAULT_TEMPO = 500000  # microseconds per quarter (120 bpm)
+DEFAULT_VELOCITY = 90
+VOICE_PROGRAM = 53  # General MIDI "Voice Oohs", music21's program for SATB voices
+
+
+def _vlq(value):
+    """Encode a non-negative int as a MIDI variable-length quantity."""
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(reversed(out))
+
+
+def _meta(delta, kind, data):
+    return _vlq(delta) + bytes([0xFF, kind]) + _vlq(len(data)) + data
+
+
+def _chunk(kind, data):
+    return kind + struct.pack('>I', len(data)) + data
+
+
+def _conductor_track(tempo):
+    data = _meta(0, 0x51, tempo.to_bytes(3, 'big'))
+    data += _meta(0, 0x58, bytes([4, 2, 24, 8]))
+    data += _meta(TICKS_PER_QUARTER, 0x2F, b'')
+    return _chunk(b'MTrk', data)
+
+
+def _voice_track(name, notes, channel, program, velocity):
+    """
+    Encode one voice.
+
+    ``notes`` is an iterable of (offset, duration, midi_pitch, lyric) with
+    offset and duration in quarter lengths; lyric may be '' or None. An
+    optional fifth item overrides the velocity for that note.
+    """
+    data = _meta(0, 0x03, name.encode('utf-8'))
+    data += bytes([0x00, 0xC0 | channel, program])
+    now = 0
+    for offset, duration, pitch, lyric, *note_velocity in notes:
+        start = int(round(offset * TICKS_PER_QUARTER))
+        end = max(start, int(round((offset + duration) * TICKS_PER_QUARTER)))
+        delta = max(0, start - now)
+        if lyric:
+            data += _meta(delta, 0x05, lyric.encode('utf-8'))
+            delta = 0
+        data += _vlq(delta) + bytes([0x90 | channel, pitch, note_velocity[0] if note_velocity else velocity])
+        data += _vlq(end - max(start, now)) + bytes([0x80 | channel, pitch, 0])
+        now = end
+    data += _meta(TICKS_PER_QUARTER, 0x2F, b'')
+    return _chunk(b'MTrk', data)
+
+
+def write_midi(path, voices, tempo=DEFAULT_TEMPO, program=VOICE_PROGRAM, velocity=DEFAULT_VELOCITY):
+    """
+    Write note events straight to a Standard MIDI File.
+
+    Args:
+        path (str): Output .mid path
+        voices (list): (track name, notes) pairs, one track each; notes are
+            (offset, duration, midi_pitch, lyric[, velocity]) tuples in quarter lengths,
+            sorted by offset and not overlapping within a voice
+        tempo (int): Microseconds per quarter note
+        program (int): General MIDI program for every voice
+        velocity (int): Note-on velocity
+
+    Returns:
+        str: ``path``
+    """
+    tracks = [_conductor_track(tempo)]
+    for channel, (name, notes) in enumerate(voices):
+        tracks.append(_voice_track(name, notes, channel % 16, program, velocity))
+    header = _chunk(b'MThd', struct.pack('>HHH', 1, len(tracks), TICKS_PER_QUARTER))
+    with open(path, 'wb') as f:
+        f.write(header + b''.join(tracks))
+    return path
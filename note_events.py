@@ -0,0 +1,108 @@
+import numpy as np
+
+from midi_writer import DEFAULT_VELOCITY
+from solfege import SYLLABLES
+from voice_assignment import greedy_assignment, viterbi_assignment
+
+"""
+Note-event table for the SATB pipeline.
+
+The transcription is held as one structured NumPy array with a row per
+voice per onset (voice-major, in onset order within a voice):
+
+    onset     float64  offset in quarter lengths
+    duration  float64  length in quarter lengths
+    midi      int8     MIDI pitch, REST (-1) where the voice is silent
+    voice     uint8    index into VOICES
+    velocity  uint8    MIDI note-on velocity
+    syllable  int8     index into solfege.SYLLABLES, -1 for no lyric
+
+music21 objects are only built from it by the exports that need them.
+"""
+
+VOICES = ('soprano', 'alto', 'tenor', 'bass')
+
+VOCAL_RANGES = {
+    'soprano': (60, 83),
+    'alto': (53, 76),
+    'tenor': (48, 69),
+    'bass': (36, 60),
+}
+
+REST = -1
+
+NOTE_EVENT_DTYPE = np.dtype([
+    ('onset', np.float64),
+    ('duration', np.float64),
+    ('midi', np.int8),
+    ('voice', np.uint8),
+    ('velocity', np.uint8),
+    ('syllable', np.int8),
+])
+
+
+def onset_grid(onset_times):
+    """
+    Offsets and durations for a sequence of onsets.
+
+    Each note lasts until the next onset; the last one repeats the previous
+    duration (1.0 when there is a single onset).
+
+    Args:
+        onset_times (np.ndarray): Onset times, ascending
+
+    Returns:
+        tuple: (offsets, durations) float64 arrays
+    """
+    onset_times = np.asarray(onset_times, dtype=np.float64)
+    durations = np.diff(onset_times)
+    durations = np.append(durations, durations[-1] if len(durations) else 1.0)[:len(onset_times)]
+    offsets = np.concatenate(([0.0], np.cumsum(durations[:-1])))[:len(onset_times)]
+    return offsets, durations
+
+
+def assign_voices(onset_times, candidates, vocal_ranges=VOCAL_RANGES, velocity=DEFAULT_VELOCITY, method='viterbi'):
+    """
+    Build the note-event table by assigning each onset's candidate pitches to voices.
+
+    Args:
+        onset_times (np.ndarray): Onset times, ascending
+        candidates (np.ndarray): (n_onsets, k) MIDI candidates, strongest
+            first, -1 padded
+        vocal_ranges (dict): Voice -> (lowest, highest) MIDI pitch
+        velocity (int): Velocity for every note
+        method (str): 'viterbi' to choose assignments over the whole song
+            with voice-leading costs, or 'greedy' to fill voices top-down at
+            each onset independently (see voice_assignment)
+
+    Returns:
+        np.ndarray: Table with NOTE_EVENT_DTYPE, syllables unset (-1)
+    """
+    offsets, durations = onset_grid(onset_times)
+    n = len(offsets)
+    ranges = [vocal_ranges[voice] for voice in VOICES]
+    if method == 'viterbi':
+        midi = viterbi_assignment(candidates, ranges)
+    elif method == 'greedy':
+        midi = greedy_assignment(candidates, ranges)
+    else:
+        raise ValueError(f"Unknown voice assignment method: {method}")
+    table = np.empty(len(VOICES) * n, dtype=NOTE_EVENT_DTYPE)
+    table['onset'] = np.tile(offsets, len(VOICES))
+    table['duration'] = np.tile(durations, len(VOICES))
+    table['midi'] = midi.ravel()
+    table['voice'] = np.repeat(np.arange(len(VOICES), dtype=np.uint8), n)
+    table['velocity'] = np.where(table['midi'] == REST, 0, velocity)
+    table['syllable'] = -1
+    return table
+
+
+def voice_events(table, voice):
+    """Rows of the table for one voice (name or index)."""
+    index = VOICES.index(voice) if isinstance(voice, str) else voice
+    return table[table['voice'] == index]
+
+
+def lyrics(table):
+    """Syllable text per row, None where there is no lyric."""
+    return [SYLLABLES[s] if s >= 0 else None for s in table['syllable'].tolist()]
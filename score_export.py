@@ -0,0 +1,255 @@
+import atexit
+import os
+import threading
+import time
+
+import numpy as np
+from music21 import stream, note, instrument
+from midi_writer import write_midi
+from precompress import write_precompressed, remove_precompressed
+from note_events import VOICES, REST, lyrics
+
+"""
+Score export for the SATB pipeline.
+
+Each export task writes one file (the full score or a single voice, as MIDI
+or MusicXML) from rows of the note-event table (see note_events), so tasks
+can run in worker processes without pickling music21 streams, and music21
+objects are only built for the MusicXML files.
+"""
+
+VOICE_INSTRUMENTS = {
+    'soprano': instrument.Soprano,
+    'alto': instrument.Alto,
+    'tenor': instrument.Tenor,
+    'bass': instrument.Bass,
+}
+
+# Default MusicXML writer processes; each holds music21 in memory while the pool lives
+EXPORT_WORKERS = int(os.getenv('SATB_EXPORT_WORKERS', str(min(4, os.cpu_count() or 1))))
+# Seconds without exports before the pool's processes are shut down
+EXPORT_POOL_IDLE = float(os.getenv('SATB_EXPORT_POOL_IDLE', '300'))
+
+_export_pool = None
+_export_pool_size = 0
+_export_pool_lock = threading.Lock()
+_export_pool_users = 0
+_export_pool_timer = None
+
+
+def build_part(events):
+    """Build a music21 Part for one voice from its rows of the note-event table."""
+    voice = VOICES[events['voice'][0]]
+    part = stream.Part(id=voice)
+    part.append(VOICE_INSTRUMENTS[voice]())
+    for duration, pitch, lyric in zip(events['duration'].tolist(), events['midi'].tolist(), lyrics(events)):
+        if pitch == REST:
+            part.append(note.Rest(quarterLength=duration))
+        else:
+            n = note.Note(pitch)
+            n.quarterLength = duration
+            n.lyric = lyric
+            part.append(n)
+    return part
+
+
+def write_voices(path, fmt, events):
+    """
+    Write one export file.
+
+    Args:
+        path (str): Output path
+        fmt (str): 'midi' or 'musicxml'
+        events (np.ndarray): Note-event rows for the voices in this file;
+            one voice writes a single part, several write a score
+
+    Returns:
+        float: Seconds spent writing
+    """
+    start = time.perf_counter()
+    voices = [events[events['voice'] == v] for v in np.unique(events['voice'])]
+    if fmt == 'midi':
+        tracks = []
+        for rows in voices:
+            sung = rows[rows['midi'] != REST]
+            tracks.append((VOICES[rows['voice'][0]].capitalize(), list(zip(
+                sung['onset'].tolist(), sung['duration'].tolist(), sung['midi'].tolist(),
+                lyrics(sung), sung['velocity'].tolist()
+            ))))
+        write_midi(path, tracks)
+    elif fmt == 'musicxml':
+        parts = [build_part(rows) for rows in voices]
+        if len(parts) == 1:
+            parts[0].write('musicxml', fp=path)
+        else:
+            score = stream.Score()
+            for part in parts:
+                score.append(part)
+            score.write('musicxml', fp=path)
+        # Compressed once here (in the worker) rather than per web request
+        write_precompressed(path)
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+    return time.perf_counter() - start
+
+
+def _submit(workers, calls):
+    """
+    Submit calls to the process pool reused across jobs, so workers only import music21 once.
+
+    Several job threads export at once, so the pool is only created,
+    resized or discarded under _export_pool_lock, and submissions happen
+    under it too (a resize shuts the old pool down for new work). Every
+    successful call must be paired with _release_pool().
+
+    Returns:
+        tuple: (pool, list of futures in ``calls`` order)
+    """
+    global _export_pool, _export_pool_size, _export_pool_users
+    from concurrent.futures import BrokenExecutor
+    with _export_pool_lock:
+        if _export_pool_timer is not None:
+            _export_pool_timer.cancel()
+        if _export_pool is None or _export_pool_size < workers:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            if _export_pool is not None:
+                # Work already submitted by other jobs still runs to completion
+                _export_pool.shutdown(wait=False)
+            _export_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _export_pool_size = workers
+        try:
+            futures = [_export_pool.submit(fn, *args) for fn, *args in calls]
+        except BrokenExecutor:
+            # A worker died since the last export; the next one starts a fresh pool
+            _export_pool.shutdown(wait=False)
+            _export_pool = None
+            _export_pool_size = 0
+            raise
+        _export_pool_users += 1
+        return _export_pool, futures
+
+
+def _release_pool(pool):
+    """An export is done with the pool; once none are, shut it down after EXPORT_POOL_IDLE seconds."""
+    global _export_pool_users, _export_pool_timer
+    with _export_pool_lock:
+        _export_pool_users -= 1
+        if _export_pool_users == 0 and _export_pool is pool:
+            _export_pool_timer = threading.Timer(EXPORT_POOL_IDLE, _shutdown_idle_pool, args=(pool,))
+            _export_pool_timer.daemon = True
+            _export_pool_timer.start()
+
+
+def _shutdown_idle_pool(pool):
+    """Timer callback: stop an unused pool's worker processes."""
+    global _export_pool, _export_pool_size
+    with _export_pool_lock:
+        if _export_pool is not pool or _export_pool_users:
+            return  # replaced, or in use again
+        _export_pool = None
+        _export_pool_size = 0
+    pool.shutdown(wait=True)
+
+
+def _discard_pool(pool):
+    """Drop a broken pool so the next export starts a fresh one."""
+    global _export_pool, _export_pool_size
+    with _export_pool_lock:
+        if _export_pool is not pool:
+            return  # another job already replaced it
+        # No cancel_futures: other jobs' futures fail with BrokenProcessPool on their own
+        pool.shutdown(wait=False)
+        _export_pool = None
+        _export_pool_size = 0
+
+
+@atexit.register
+def _shutdown_pool():
+    """Stop the pool's worker processes when the interpreter exits."""
+    global _export_pool
+    with _export_pool_lock:
+        pool, _export_pool = _export_pool, None
+        if _export_pool_timer is not None:
+            _export_pool_timer.cancel()
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def export_files(tasks, jobs=None, on_file=None):
+    """
+    Run export tasks, with the MusicXML writers in worker processes.
+
+    MIDI files take milliseconds to write, so they are written here while
+    the workers run music21; worker processes are only worth their startup
+    cost for MusicXML.
+
+    Args:
+        tasks (list): (key, path, fmt, events) tuples, one per output file
+        jobs (int): Worker processes (default: EXPORT_WORKERS, capped at the
+            number of MusicXML tasks); 1 writes everything in this process
+        on_file (callable): Called with (key, path) as soon as each file is written
+
+    Returns:
+        dict: key -> path, in task order
+
+    Raises:
+        RuntimeError: If any writer fails; files from this export are removed
+    """
+    pooled = [task for task in tasks if task[2] != 'midi']
+    workers = min(jobs or EXPORT_WORKERS, len(pooled))
+    if workers <= 1:
+        pooled = []
+    start = time.perf_counter()
+    busy = 0.0
+    futures = {}
+    try:
+        if pooled:
+            pool, submitted = _submit(workers, [(write_voices, path, fmt, events) for _, path, fmt, events in pooled])
+            futures = dict(zip(submitted, (key for key, _, _, _ in pooled)))
+        for key, path, fmt, events in tasks:
+            if futures and fmt != 'midi':
+                continue
+            try:
+                busy += write_voices(path, fmt, events)
+            except Exception as e:
+                raise RuntimeError(f"Export of {key} failed: {e}") from e
+            if on_file:
+                on_file(key, path)
+        if futures:
+            from concurrent.futures import as_completed
+            from concurrent.futures.process import BrokenProcessPool
+            paths = {key: path for key, path, _, _ in pooled}
+            for future in as_completed(futures):
+                try:
+                    busy += future.result()
+                except Exception as e:
+                    # Includes CancelledError, so every failure gets the cleanup below
+                    if isinstance(e, BrokenProcessPool):
+                        # A worker died; start a fresh pool next time
+                        _discard_pool(pool)
+                    raise RuntimeError(f"Export of {futures[future]} failed: {type(e).__name__}: {e}") from e
+                if on_file:
+                    on_file(futures[future], paths[futures[future]])
+    except RuntimeError:
+        # Stop the other writers and don't leave a half-written set of outputs behind
+        if futures:
+            from concurrent.futures import wait
+            for future in futures:
+                future.cancel()
+            wait(futures)
+        for _, path, _, _ in tasks:
+            if os.path.exists(path):
+                os.unlink(path)
+            remove_precompressed(path)
+        raise
+    finally:
+        if futures:
+            _release_pool(pool)
+    wall = time.perf_counter() - start
+    if futures:
+        print(f"Exported {len(tasks)} files in {wall:.2f}s "
+              f"({busy:.2f}s of writer time, {busy - wall:.2f}s saved with {workers} workers)")
+    else:
+        print(f"Exported {len(tasks)} files in {wall:.2f}s in this process")
+    return {key: path for key, path, _, _ in tasks}
@@ -0,0 +1,87 @@
+import numpy as np
+
+"""
+Solfège lookup tables.
+
+Every syllable is precomputed per pitch class: one table for fixed do and
+one per tonic (12) and mode (major/minor) for movable do, including the
+chromatic syllables, so labelling a voice is a single array lookup.
+
+Movable do uses do-based minor. Chromatic notes are spelled the way they
+usually function: in major the raised Di, Fi, Si and the lowered Me, Te;
+in minor the lowered Ra, Me, Le, Te and the raised Fi, with Mi, La and Ti
+for the raised 3rd, 6th and 7th. Fixed do spells every black key sharp
+(Di, Ri, Fi, Si, Li).
+"""
+
+KEY_NAMES = ('C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B')
+
+# Syllable vocabulary; lyric tables and note_events store indices into it
+SYLLABLES = (
+    'Do', 'Di', 'Ra', 'Re', 'Ri', 'Me', 'Mi', 'Fa', 'Fi', 'Se',
+    'Sol', 'Si', 'Le', 'La', 'Li', 'Te', 'Ti',
+)
+
+# Syllable per semitone above the tonic (fixed do: above C)
+FIXED_SCALE = ('Do', 'Di', 'Re', 'Ri', 'Mi', 'Fa', 'Fi', 'Sol', 'Si', 'La', 'Li', 'Ti')
+MAJOR_SCALE = ('Do', 'Di', 'Re', 'Me', 'Mi', 'Fa', 'Fi', 'Sol', 'Si', 'La', 'Te', 'Ti')
+MINOR_SCALE = ('Do', 'Ra', 'Re', 'Me', 'Mi', 'Fa', 'Fi', 'Sol', 'Le', 'La', 'Te', 'Ti')
+
+MODES = ('major', 'minor')
+
+
+def _indices(names):
+    return np.array([SYLLABLES.index(name) for name in names], dtype=np.int8)
+
+
+FIXED_TABLE = _indices(FIXED_SCALE)
+
+# MOVABLE_TABLES[mode, tonic, pitch_class] -> syllable index
+MOVABLE_TABLES = np.stack([
+    np.stack([np.roll(_indices(names), tonic) for tonic in range(12)])
+    for names in (MAJOR_SCALE, MINOR_SCALE)
+])
+
+
+def syllable_table(system='fixed', tonic=0, mode='major'):
+    """
+    Syllable index per pitch class (0 = C).
+
+    Args:
+        system (str): 'fixed' or 'movable'
+        tonic (int or str): Tonic pitch class or key name (movable do only)
+        mode (str): 'major' or 'minor' (movable do only)
+
+    Returns:
+        np.ndarray: 12 int8 indices into SYLLABLES
+    """
+    if system == 'fixed':
+        return FIXED_TABLE
+    if system != 'movable':
+        raise ValueError(f"Unknown solfege system: {system}")
+    if isinstance(tonic, str):
+        tonic = KEY_NAMES.index(tonic)
+    return MOVABLE_TABLES[MODES.index(mode), tonic % 12]
+
+
+def label(midi, system='fixed', tonic=0, mode='major'):
+    """
+    Syllable indices for an array of MIDI pitches.
+
+    Args:
+        midi (np.ndarray): MIDI pitches; negative values (rests) get -1
+        system (str): 'fixed' or 'movable'
+        tonic (int or str): Tonic pitch class or key name (movable do only)
+        mode (str): 'major' or 'minor' (movable do only)
+
+    Returns:
+        np.ndarray: int8 indices into SYLLABLES, -1 for rests
+    """
+    midi = np.asarray(midi)
+    table = syllable_table(system, tonic, mode)
+    return np.where(midi >= 0, table[midi % 12], -1).astype(np.int8)
+
+
+def syllable(midi_pitch, system='fixed', tonic=0, mode='major'):
+    """Syllable text for a single MIDI pitch."""
+    return SYLLABLES[syllable_table(system, tonic, mode)[midi_pitch % 12]]
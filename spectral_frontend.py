@@ -0,0 +1,343 @@
+from functools import cached_property
+
+import librosa
+import numpy as np
+import soundfile as sf
+import soxr
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def median_filter_1d(S, kernel_size, axis, block_size=(32, 4096)):
+    """
+    Median-filter a 2-D array along one axis.
+
+    Equivalent to ``scipy.ndimage.median_filter`` with a 1-D kernel and
+    ``mode='reflect'``, but works on tiles of strided windows with
+    ``np.partition``, which is several times faster for HPSS-sized kernels
+    and keeps the temporary window copies bounded.
+
+    Args:
+        S (np.ndarray): 2-D input array
+        kernel_size (int): Filter length
+        axis (int): Axis to filter along (0 or 1)
+        block_size (tuple): Tile size as (across the axis, along the axis)
+
+    Returns:
+        np.ndarray: Filtered array with the same shape and dtype as ``S``
+    """
+    half = kernel_size // 2
+    pad = [(0, 0), (0, 0)]
+    pad[axis] = (half, kernel_size - 1 - half)
+    # numpy's 'symmetric' padding is scipy.ndimage's 'reflect'
+    padded = np.pad(S, pad, mode='symmetric')
+    out = np.empty_like(S)
+    other = 1 - axis
+    across, along = block_size
+    for i in range(0, S.shape[other], across):
+        for j in range(0, S.shape[axis], along):
+            src = [None, None]
+            dst = [None, None]
+            src[other] = dst[other] = slice(i, i + across)
+            dst[axis] = slice(j, j + along)
+            src[axis] = slice(j, j + along + kernel_size - 1)
+            windows = sliding_window_view(padded[tuple(src)], kernel_size, axis=axis)
+            out[tuple(dst)] = np.partition(windows, half, axis=-1)[..., half]
+    return out
+
+
+def harmonic_spectrum(magnitude, kernel_size=31):
+    """
+    Harmonic part of a magnitude spectrogram.
+
+    Uses the same soft masks as ``librosa.decompose.hpss`` (margin 1,
+    power 2), without building the percussive output we never use. A
+    ``kernel_size`` of None skips HPSS and returns ``magnitude`` unchanged.
+    """
+    if not kernel_size:
+        return magnitude
+    harm = median_filter_1d(magnitude, kernel_size, axis=1)
+    perc = median_filter_1d(magnitude, kernel_size, axis=0)
+    mask = librosa.util.softmask(harm, perc, power=2, split_zeros=True)
+    return magnitude * mask
+
+
+def extract_pitch_candidates(pitches, mags, frames, threshold=0.1, midi_range=(36, 83), max_candidates=4):
+    """
+    Pick the strongest MIDI pitch candidates for every frame in one NumPy pass.
+
+    Args:
+        pitches (np.ndarray): piptrack pitch matrix (bins x frames), in Hz
+        mags (np.ndarray): piptrack magnitude matrix (bins x frames)
+        frames (array-like): Frame indices to analyse (e.g. onset frames)
+        threshold (float): Minimum magnitude for a bin to count as a candidate
+        midi_range (tuple): Inclusive (low, high) MIDI range to keep
+        max_candidates (int): How many candidates to keep per frame
+
+    Returns:
+        np.ndarray: int array of shape (len(frames), max_candidates), strongest
+        first, padded with -1 where a frame has fewer candidates
+    """
+    frames = np.asarray(frames, dtype=int)
+    frame_pitches = pitches[:, frames]
+    frame_mags = mags[:, frames]
+    valid = frame_mags > threshold
+    midi = np.full(frame_pitches.shape, -1, dtype=int)
+    # Only convert bins above threshold; the rest would be log(0)
+    midi[valid] = np.round(librosa.hz_to_midi(frame_pitches[valid])).astype(int)
+    valid &= (midi >= midi_range[0]) & (midi <= midi_range[1])
+    # Stable sort on the negated magnitude keeps ties in bin order, like list.sort
+    strength = np.where(valid, frame_mags, -np.inf)
+    order = np.argsort(-strength, axis=0, kind='stable')[:max_candidates]
+    top_midi = np.take_along_axis(midi, order, axis=0)
+    top_valid = np.take_along_axis(valid, order, axis=0)
+    return np.where(top_valid, top_midi, -1).T
+
+
+def excerpt_frames(n_frames, max_frames):
+    """Slice of at most ``max_frames`` frames from the middle of a track (None = all frames)."""
+    if not max_frames or max_frames >= n_frames:
+        return slice(0, n_frames)
+    start = (n_frames - max_frames) // 2
+    return slice(start, start + max_frames)
+
+
+class SpectralFrontEnd:
+    """
+    Shared analysis front-end for the SATB pipeline.
+
+    The STFT magnitude is computed once when the object is created. Onset
+    strength, harmonic/percussive separation, pitch tracking and chroma are
+    all derived from that one cached spectrum, so the waveform is never
+    transformed twice and HPSS never goes back to the time domain.
+
+    Args:
+        y (np.ndarray): Mono audio signal
+        sr (int): Sample rate of ``y``
+        n_fft (int): FFT size
+        hop_length (int): Hop between frames, in samples
+        hpss_kernel (int): Median filter length used for HPSS, or None to skip HPSS
+    """
+
+    def __init__(self, y, sr, n_fft=2048, hop_length=512, hpss_kernel=31):
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.hpss_kernel = hpss_kernel
+        # Phase is never needed downstream, so only the magnitude is kept
+        self.magnitude = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length))
+
+    @property
+    def n_frames(self):
+        return self.magnitude.shape[1]
+
+    @cached_property
+    def harmonic(self):
+        """Harmonic part of the magnitude spectrogram (HPSS in the spectral domain)."""
+        return harmonic_spectrum(self.magnitude, self.hpss_kernel)
+
+    def onset_strength(self):
+        """Onset strength envelope from a log-mel view of the cached spectrum."""
+        mel = librosa.feature.melspectrogram(S=self.magnitude ** 2, sr=self.sr)
+        return librosa.onset.onset_strength(
+            S=librosa.power_to_db(mel), sr=self.sr, n_fft=self.n_fft, hop_length=self.hop_length
+        )
+
+    def onset_frames(self):
+        """Frame indices of detected onsets."""
+        return librosa.onset.onset_detect(
+            onset_envelope=self.onset_strength(), sr=self.sr, hop_length=self.hop_length
+        )
+
+    def frames_to_time(self, frames):
+        return librosa.frames_to_time(frames, sr=self.sr, hop_length=self.hop_length)
+
+    def piptrack(self, harmonic=None):
+        """Pitch and magnitude matrices of the harmonic spectrum (``self.harmonic`` unless given)."""
+        if harmonic is None:
+            harmonic = self.harmonic
+        return librosa.piptrack(S=harmonic, sr=self.sr, n_fft=self.n_fft, hop_length=self.hop_length)
+
+    def chroma(self, frames=slice(None)):
+        """Chromagram computed from the cached power spectrum (optionally a slice of frames)."""
+        return librosa.feature.chroma_stft(
+            S=self.magnitude[:, frames] ** 2, sr=self.sr, n_fft=self.n_fft, hop_length=self.hop_length
+        )
+
+    def chroma_profile(self, max_frames=None):
+        """Chroma energy summed over the track, or its middle ``max_frames`` frames (12 values, C first)."""
+        return self.chroma(excerpt_frames(self.n_frames, max_frames)).sum(axis=1)
+
+
+class StreamingFrontEnd:
+    """
+    Bounded-memory counterpart of :class:`SpectralFrontEnd`.
+
+    Reads the file in blocks of ``block_frames`` STFT frames plus enough
+    context on either side for HPSS and onset peak picking, so only one
+    block of samples and spectra is held in memory at a time. Spectra, HPSS
+    and pitch tracking match the batch front-end frame for frame. Onset
+    picking carries its state (the ``wait`` window and the running envelope
+    maximum) across blocks; because the threshold follows the running
+    maximum rather than the whole-file maximum, onsets near the start of a
+    recording can differ slightly from batch mode.
+
+    Args:
+        path (str): Audio file readable by soundfile
+        sr (int): Analysis sample rate; None keeps the file's native rate
+        n_fft (int): FFT size
+        hop_length (int): Hop between frames, in samples
+        hpss_kernel (int): Median filter length used for HPSS, or None to skip HPSS
+        block_frames (int): STFT frames analysed per block
+        chroma_max_frames (int): Only sum chroma over this many frames from
+            the middle of the file (default: all)
+        chroma (bool): Accumulate the chroma profile; False skips it
+    """
+
+    # librosa.onset.onset_detect defaults, in seconds (delta is relative)
+    PRE_MAX, POST_MAX, PRE_AVG, POST_AVG, WAIT, DELTA = 0.03, 0.0, 0.10, 0.10, 0.03, 0.07
+    TOP_DB = 80.0
+
+    def __init__(self, path, sr=None, n_fft=2048, hop_length=512, hpss_kernel=31, block_frames=2048, chroma_max_frames=None, chroma=True):
+        self.path = path
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.hpss_kernel = hpss_kernel
+        self.block_frames = block_frames
+        with sf.SoundFile(path) as f:
+            self.native_sr = f.samplerate
+            native_samples = f.frames
+        self.sr = sr or self.native_sr
+        # Same output length as librosa.load(path, sr=sr)
+        self.n_samples = int(np.ceil(native_samples * self.sr / self.native_sr))
+        self.n_frames = 1 + self.n_samples // hop_length
+        self.pre_max = int(self.PRE_MAX * self.sr // hop_length)
+        self.post_max = int(self.POST_MAX * self.sr // hop_length) + 1
+        self.pre_avg = int(self.PRE_AVG * self.sr // hop_length)
+        self.post_avg = int(self.POST_AVG * self.sr // hop_length) + 1
+        self.wait = int(self.WAIT * self.sr // hop_length)
+        # Offset between a frame and the mel difference that lands on it
+        self.env_shift = 1 + n_fft // (2 * hop_length)
+        self._chroma = np.zeros(12)
+        # An empty range when chroma is off, so no block sums any
+        self.chroma_frames = excerpt_frames(self.n_frames, chroma_max_frames) if chroma else slice(0, 0)
+
+    def frames_to_time(self, frames):
+        return librosa.frames_to_time(frames, sr=self.sr, hop_length=self.hop_length)
+
+    def chroma_profile(self):
+        """Chroma energy summed over every block analysed so far."""
+        return self._chroma
+
+    def _chunks(self, f, chunk_size=65536):
+        """Yield mono float32 chunks of the file at the analysis sample rate."""
+        resampler = None
+        if self.sr != self.native_sr:
+            # soxr's streaming resampler gives the same samples as librosa.load(sr=...)
+            resampler = soxr.ResampleStream(self.native_sr, self.sr, 1, dtype='float32', quality='HQ')
+        while True:
+            chunk = f.read(chunk_size, dtype='float32', always_2d=True).mean(axis=1)
+            last = len(chunk) < chunk_size
+            if resampler is not None:
+                chunk = resampler.resample_chunk(chunk, last=last)
+            yield chunk
+            if last:
+                return
+
+    def _blocks(self):
+        """Yield (start, stop, lo, magnitude) with magnitude covering frames lo.."""
+        half = self.n_fft // 2
+        hpss_half = (self.hpss_kernel or 1) // 2
+        lead = max(hpss_half, self.pre_avg + self.env_shift)
+        lag = max(hpss_half, self.post_avg)
+        buf = np.zeros(0, dtype=np.float32)
+        buf_start = 0
+        with sf.SoundFile(self.path) as f:
+            chunks = self._chunks(f)
+            for start in range(0, self.n_frames, self.block_frames):
+                stop = min(self.n_frames, start + self.block_frames)
+                lo = max(0, start - lead)
+                hi = min(self.n_frames, stop + lag)
+                seg_start = lo * self.hop_length - half
+                seg_end = (hi - 1) * self.hop_length + half
+                # Read forward until the buffer covers this segment
+                pieces = [buf]
+                have = buf_start + len(buf)
+                while have < min(seg_end, self.n_samples):
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    pieces.append(chunk)
+                    have += len(chunk)
+                buf = np.concatenate(pieces)
+                # Drop samples no later block will need
+                keep_from = max(0, seg_start)
+                buf = buf[keep_from - buf_start:]
+                buf_start = keep_from
+                # Zero padding at the file edges, like the centred batch STFT
+                seg = np.zeros(seg_end - seg_start, dtype=np.float32)
+                avail = buf[:max(0, min(seg_end, self.n_samples) - buf_start)]
+                offset = buf_start - seg_start
+                seg[offset:offset + len(avail)] = avail
+                magnitude = np.abs(librosa.stft(seg, n_fft=self.n_fft, hop_length=self.hop_length, center=False))
+                yield start, stop, lo, magnitude
+
+    def iter_onsets(self):
+        """
+        Analyse the file block by block.
+
+        Yields:
+            tuple: (onset frame, candidate MIDI pitches) in time order, with
+            candidates as returned by ``extract_pitch_candidates``
+        """
+        db_max = -np.inf
+        env_max = 0.0
+        last_onset = None
+        for start, stop, lo, magnitude in self._blocks():
+            block = slice(start - lo, stop - lo)
+            chroma_start = max(start, self.chroma_frames.start)
+            chroma_stop = min(stop, self.chroma_frames.stop)
+            if chroma_start < chroma_stop:
+                self._chroma += librosa.feature.chroma_stft(
+                    S=magnitude[:, chroma_start - lo:chroma_stop - lo] ** 2,
+                    sr=self.sr, n_fft=self.n_fft, hop_length=self.hop_length
+                ).sum(axis=1)
+            # Onset envelope from the log-mel spectrum, floored TOP_DB below
+            # the loudest value seen so far
+            mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=magnitude ** 2, sr=self.sr), top_db=None)
+            db_max = max(db_max, mel_db.max())
+            mel_db = np.maximum(mel_db, db_max - self.TOP_DB)
+            flux = np.maximum(0.0, np.diff(mel_db, axis=1)).mean(axis=0)
+            env = np.zeros(magnitude.shape[1], dtype=flux.dtype)
+            env[self.env_shift:] = flux[:len(env) - self.env_shift]
+            env_max = max(env_max, env.max())
+            onsets = self._pick(env, lo, start, stop, env_max, last_onset)
+            if not onsets:
+                continue
+            last_onset = onsets[-1]
+            harmonic = harmonic_spectrum(magnitude, self.hpss_kernel)
+            pitches, mags = librosa.piptrack(
+                S=harmonic[:, block], sr=self.sr, n_fft=self.n_fft, hop_length=self.hop_length
+            )
+            candidates = extract_pitch_candidates(pitches, mags, np.asarray(onsets) - start)
+            for frame, row in zip(onsets, candidates):
+                yield frame, row
+
+    def _pick(self, env, lo, start, stop, env_max, last_onset):
+        """Peak-pick frames [start, stop) of a block envelope whose first frame is ``lo``."""
+        if env_max <= 0:
+            return []
+        delta = self.DELTA * env_max
+        onsets = []
+        for frame in range(start, stop):
+            if last_onset is not None and frame <= last_onset + self.wait:
+                continue
+            i = frame - lo
+            window = env[max(0, frame - self.pre_max) - lo:min(frame + self.post_max, self.n_frames) - lo]
+            if env[i] != window.max():
+                continue
+            window = env[max(0, frame - self.pre_avg) - lo:min(frame + self.post_avg, self.n_frames) - lo]
+            if env[i] < window.mean() + delta:
+                continue
+            onsets.append(frame)
+            last_onset = frame
+        return onsets
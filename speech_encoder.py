@@ -0,0 +1,149 @@
+import io
+
+import numpy as np
+import soundfile as sf
+import soxr
+
+"""
+Pre-upload compression for transcription.
+
+Recordings are 44.1 kHz stereo int16 WAV, far more than speech recognition
+needs. encode_speech() reads the file block by block, downmixes to mono,
+resamples to 16 kHz (soxr, which ships with librosa) and encodes to
+Ogg/Opus or FLAC into an in-memory sink, with no temp file. Opus pages are
+yielded as soon as they are written, so they stream as a chunked upload body
+while the rest of the file is still being encoded. FLAC rewrites its header
+when the file is closed, so it is held in memory until then.
+"""
+
+SPEECH_SAMPLE_RATE = 16000
+UPLOAD_FORMATS = {
+    'opus': ('OGG', 'OPUS'),
+    'flac': ('FLAC', 'PCM_16'),
+}
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+BLOCK_FRAMES = 1 << 16
+CHUNK_SIZE = 64 << 10
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file object for libsndfile that hands out bytes as they arrive.
+
+    Rewrites of bytes already handed out are dropped, so only take() before
+    close from encoders that write strictly forward (Ogg).
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._sent = 0
+        self._pos = 0
+        self._end = 0
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._end
+        self._pos = offset
+        return self._pos
+
+    def write(self, data):
+        data = bytes(data)
+        written = len(data)
+        start = self._pos - self._sent
+        if start < 0:
+            data, start = data[-start:], 0
+        end = start + len(data)
+        if end > len(self._buffer):
+            self._buffer.extend(bytes(end - len(self._buffer)))
+        self._buffer[start:end] = data
+        self._pos += written
+        self._end = max(self._end, self._pos)
+        return written
+
+    def pending(self):
+        return len(self._buffer)
+
+    def take(self):
+        """Bytes written since the last take()."""
+        chunk = bytes(self._buffer)
+        self._sent += len(chunk)
+        self._buffer.clear()
+        return chunk
+
+
+def can_encode(audio_path):
+    """Whether soundfile can read the file (otherwise upload it as is)."""
+    try:
+        sf.info(audio_path)
+    except RuntimeError:
+        return False
+    return True
+
+
+def encode_speech(audio_path, fmt='opus', sample_rate=SPEECH_SAMPLE_RATE, chunk_size=CHUNK_SIZE):
+    """
+    Mono, speech-rate, compressed audio as a stream of byte chunks.
+
+    Args:
+        audio_path (str): Input audio file (anything soundfile can read)
+        fmt (str): 'opus' (Ogg/Opus, lossy, smallest) or 'flac' (lossless)
+        sample_rate (int): Output sample rate in Hz
+        chunk_size (int): Yield once this many encoded bytes are buffered
+
+    Yields:
+        bytes: Consecutive pieces of the encoded file
+    """
+    with sf.SoundFile(audio_path) as source:
+        blocks = source.blocks(BLOCK_FRAMES, dtype='float32', always_2d=True)
+        yield from encode_blocks(blocks, source.samplerate, fmt, sample_rate, chunk_size)
+
+
+def encode_blocks(blocks, input_rate, fmt='opus', sample_rate=SPEECH_SAMPLE_RATE, chunk_size=CHUNK_SIZE):
+    """
+    encode_speech() for audio that is still arriving, e.g. from a recorder.
+
+    Args:
+        blocks (iterable): (frames, channels) arrays, float or int16
+        input_rate (int): Sample rate of the blocks in Hz
+        fmt (str): 'opus' or 'flac'; only Opus is handed out before the last block
+        sample_rate (int): Output sample rate in Hz
+        chunk_size (int): Yield once this many encoded bytes are buffered
+
+    Yields:
+        bytes: Consecutive pieces of the encoded file
+    """
+    container, subtype = UPLOAD_FORMATS[fmt]
+    if fmt == 'opus' and sample_rate not in OPUS_SAMPLE_RATES:
+        raise ValueError(f"Opus needs one of {OPUS_SAMPLE_RATES} Hz, got {sample_rate}")
+
+    sink = _ChunkSink()
+    streaming = container == 'OGG'
+    resampler = None
+    if input_rate != sample_rate:
+        resampler = soxr.ResampleStream(input_rate, sample_rate, 1, dtype='float32')
+    with sf.SoundFile(sink, 'w', sample_rate, 1, format=container, subtype=subtype) as encoded:
+        for block in blocks:
+            if block.dtype == np.int16:
+                block = block / np.float32(32768)
+            mono = block.mean(axis=1, dtype=np.float32)
+            if resampler is not None:
+                mono = resampler.resample_chunk(mono)
+            encoded.write(mono)
+            if streaming and sink.pending() >= chunk_size:
+                yield sink.take()
+        if resampler is not None:
+            encoded.write(resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True))
+    tail = sink.take()
+    for offset in range(0, len(tail), chunk_size):
+        yield tail[offset:offset + chunk_size]
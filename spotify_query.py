@@ -1,42 +1,177 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 
-def search_track(query, access_token, limit=5, return_results=False):
+SEARCH_ENDPOINT = "https://api.spotify.com/v1/search"
+
+# Search results are reused for this long, for up to this many distinct queries
+SEARCH_CACHE_TTL = 600
+SEARCH_CACHE_SIZE = 512
+MAX_FANOUT = 8
+
+_search_cache = OrderedDict()
+_search_cache_lock = threading.Lock()
+_session = None
+
+
+def _get_session():
+    """Shared HTTP session, so repeated searches reuse the TLS connection."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+    return _session
+
+
+def normalize_query(query):
+    """Lowercase, drop punctuation and collapse whitespace, so trivially different transcripts share a cache entry."""
+    return " ".join(re.sub(r"[^\w\s']", " ", query.casefold()).split())
+
+
+def query_variants(text, max_words=8):
     """
-    Search for tracks on Spotify
-    
+    Candidate search queries for a noisy transcript.
+
     Args:
-        query (str): Search query
-        access_token (str): Spotify API access token
-        limit (int): Maximum number of results to return
-        return_results (bool): Whether to return results as a list
-        
+        text (str): Transcribed lyrics
+        max_words (int): Length of the shorter excerpts
+
     Returns:
-        list: List of track objects if return_results is True, otherwise None
+        list: The whole phrase, then its first and last ``max_words`` words,
+        without duplicates
     """
-    endpoint = "https://api.spotify.com/v1/search"
-    
+    words = normalize_query(text).split()
+    variants = [" ".join(words), " ".join(words[:max_words]), " ".join(words[-max_words:])]
+    return [v for i, v in enumerate(variants) if v and v not in variants[:i]]
+
+
+def _cache_get(key):
+    with _search_cache_lock:
+        entry = _search_cache.get(key)
+        if entry is None:
+            return None
+        stored_at, tracks = entry
+        if time.monotonic() - stored_at > SEARCH_CACHE_TTL:
+            del _search_cache[key]
+            return None
+        _search_cache.move_to_end(key)
+        return tracks
+
+
+def _cache_put(key, tracks):
+    with _search_cache_lock:
+        _search_cache[key] = (time.monotonic(), tracks)
+        _search_cache.move_to_end(key)
+        while len(_search_cache) > SEARCH_CACHE_SIZE:
+            _search_cache.popitem(last=False)
+
+
+def _request_search(query, access_token, limit):
     headers = {
         "Authorization": f"Bearer {access_token}"
     }
-    
+
     params = {
         "q": query,
         "type": "track",
         "limit": limit
     }
-    
-    response = requests.get(endpoint, headers=headers, params=params)
-    
+
+    return _get_session().get(SEARCH_ENDPOINT, headers=headers, params=params, timeout=10)
+
+
+def _search(query, access_token, limit, use_cache, token_provider=None):
+    """Tracks for one query from the cache or the API; None if the request failed."""
+    key = (normalize_query(query), limit)
+    if use_cache:
+        tracks = _cache_get(key)
+        if tracks is not None:
+            return tracks
+
+    response = _request_search(query, access_token, limit)
+
+    if response.status_code == 401 and token_provider is not None:
+        # Revoked or expired early: drop it and retry once with a fresh token
+        token_provider.invalidate(access_token)
+        access_token = token_provider.get_token()
+        if access_token:
+            response = _request_search(query, access_token, limit)
+
     if response.status_code != 200:
         print(f"Error: {response.status_code}")
         print(response.json())
-        if return_results:
-            return []
         return None
-    
+
     data = response.json()
     tracks = data.get("tracks", {}).get("items", [])
-    
+    if use_cache:
+        _cache_put(key, tracks)
+    return tracks
+
+
+def _search_quietly(query, access_token, limit, use_cache, token_provider):
+    """_search for fan-out: a failed variant shouldn't sink the others."""
+    try:
+        return _search(query, access_token, limit, use_cache, token_provider)
+    except requests.RequestException as e:
+        print(f"Search for {query!r} failed: {e}")
+        return None
+
+
+def _merge_tracks(results, limit):
+    """Interleave result lists by rank and drop repeated tracks."""
+    merged, seen = [], set()
+    for rank in range(max((len(tracks) for tracks in results), default=0)):
+        for tracks in results:
+            if rank < len(tracks):
+                track = tracks[rank]
+                track_id = track.get("id") or track.get("uri") or track.get("name")
+                if track_id not in seen:
+                    seen.add(track_id)
+                    merged.append(track)
+    return merged[:limit]
+
+
+def search_track(query, access_token, limit=5, return_results=False, use_cache=True, token_provider=None):
+    """
+    Search for tracks on Spotify
+
+    Args:
+        query (str or list): Search query, or several candidate queries to
+            send concurrently and merge; None or empty counts as a failed search
+        access_token (str): Spotify API access token
+        limit (int): Maximum number of results to return
+        return_results (bool): Whether to return results as a list
+        use_cache (bool): Reuse results for recently searched queries
+        token_provider (SpotifyTokenProvider): Where access_token came from;
+            if the API rejects the token (401), it is invalidated there and
+            the search is retried once with a fresh one
+
+    Returns:
+        list: List of track objects if return_results is True, otherwise None
+    """
+    if not query:
+        # e.g. transcriber() returned None after an error or timeout
+        print("Error: empty search query")
+        tracks, failed = [], True
+    elif isinstance(query, str):
+        tracks = _search(query, access_token, limit, use_cache, token_provider)
+        failed = tracks is None
+    else:
+        queries = [q for q in query if q]
+        with ThreadPoolExecutor(max_workers=max(1, min(len(queries), MAX_FANOUT))) as pool:
+            results = list(pool.map(lambda q: _search_quietly(q, access_token, limit, use_cache, token_provider), queries))
+        failed = all(r is None for r in results)
+        tracks = _merge_tracks([r for r in results if r], limit)
+
+    if failed:
+        if return_results:
+            return []
+        return None
+
     if not return_results:
         # Print track information
         for i, track in enumerate(tracks):
@@ -48,4 +183,3 @@ def search_track(query, access_token, limit=5, return_results=False):
     else:
         # Return track information as a list
         return tracks
-
@@ -34,6 +34,7 @@ document.addEventListener('DOMContentLoaded', () => {
     let audioPlayer = null;
     let isPlaying = false;
     let isRecording = false;
+    let jobRunning = false;
     let recordingInterval = null;
     
     // Initialize Verovio toolkit
@@ -128,13 +129,29 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error(`HTTP error ${response.status}`);
             }
             
-            const data = await response.json();
+            const job = await response.json();
+            resultFiles = {};
+            jobRunning = true;
+            let data = job;
+            // Already processed uploads come back finished
+            if (job.status !== 'done') {
+                data = window.EventSource ? await followJob(job) : await waitForJob(job.status_url);
+            }
+            jobRunning = false;
             resultFiles = data.files;
             
             // Update UI
             progressStatus.textContent = 'Processing complete!';
+            const alreadyShowing = !resultsSection.classList.contains('hidden');
             setTimeout(() => {
                 progressContainer.classList.add('hidden');
+                if (alreadyShowing) {
+                    // Parts were shown as they arrived; only pick up audio for the open tab
+                    if (!isPlaying) {
+                        setupAudioPlayer(currentPart);
+                    }
+                    return;
+                }
                 resultsSection.classList.remove('hidden');
                 
                 // Smoothly scroll to results
@@ -145,6 +162,7 @@ document.addEventListener('DOMContentLoaded', () => {
             }, 1000);
             
         } catch (error) {
+            jobRunning = false;
             progressStatus.textContent = `Error: ${error.message}`;
             console.error('Upload error:', error);
             showNotification(`Error: ${error.message}`, 'error');
@@ -153,6 +171,98 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
     
+    const STAGE_LABELS = {
+        decode: 'Decoding audio',
+        onset: 'Detecting onsets',
+        hpss: 'Separating harmonics',
+        pitch: 'Tracking pitch',
+        assignment: 'Assigning voices',
+        export: 'Writing score files',
+        audio: 'Rendering audio'
+    };
+    
+    function showJobProgress(update) {
+        if (!update.stage) {
+            progressStatus.textContent = 'Waiting in queue...';
+            return;
+        }
+        let text = `${STAGE_LABELS[update.stage] || update.stage}... ${Math.round(update.progress * 100)}%`;
+        if (update.eta !== null && update.eta !== undefined) {
+            text += ` (about ${Math.max(1, Math.round(update.eta))}s left)`;
+        }
+        progressStatus.textContent = text;
+    }
+    
+    // A part's file was written while the job is still running
+    function onJobFile(key, path) {
+        resultFiles[key] = path;
+        if (!key.endsWith('_audio')) {
+            return;
+        }
+        const part = key.slice(0, -'_audio'.length);
+        if (resultsSection.classList.contains('hidden')) {
+            // First rendered voice: show it right away, the rest follow
+            resultsSection.classList.remove('hidden');
+            resultsSection.scrollIntoView({ behavior: 'smooth' });
+            switchTab(part);
+        } else if (part === currentPart && !isPlaying) {
+            setupAudioPlayer(part);
+        }
+    }
+    
+    // Follow the job's Server-Sent Events until it finishes
+    function followJob(job) {
+        return new Promise((resolve, reject) => {
+            const source = new EventSource(job.events_url);
+            const parse = handler => event => handler(JSON.parse(event.data));
+            
+            source.addEventListener('status', parse(status => {
+                const files = (status.result && status.result.files) || {};
+                Object.entries(files).forEach(([key, path]) => onJobFile(key, path));
+                const running = Object.keys(status.stages).filter(name => status.stages[name].state === 'running');
+                showJobProgress({ stage: running.pop(), progress: status.progress, eta: status.eta });
+            }));
+            source.addEventListener('progress', parse(showJobProgress));
+            source.addEventListener('file', parse(file => onJobFile(file.key, file.path)));
+            source.addEventListener('done', parse(done => {
+                source.close();
+                resolve(done.result);
+            }));
+            source.addEventListener('failed', parse(failed => {
+                source.close();
+                reject(new Error(failed.error || 'Processing failed'));
+            }));
+            source.onerror = () => {
+                // The browser retries dropped streams itself; only give up on the stream if it closed for good
+                if (source.readyState === EventSource.CLOSED) {
+                    waitForJob(job.status_url).then(resolve, reject);
+                }
+            };
+        });
+    }
+    
+    // Processing runs as a background job on the server; poll until it finishes
+    async function waitForJob(statusUrl) {
+        while (true) {
+            const response = await fetch(statusUrl);
+            if (!response.ok) {
+                throw new Error(`HTTP error ${response.status}`);
+            }
+            
+            const job = await response.json();
+            if (job.status === 'done') {
+                return job.result;
+            }
+            if (job.status === 'failed') {
+                throw new Error(job.error || 'Processing failed');
+            }
+            
+            const running = Object.entries(job.stages).find(([, stage]) => stage.state === 'running');
+            progressStatus.textContent = running ? `Processing your audio file (${running[0]})...` : 'Waiting in queue...';
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    }
+    
     function switchTab(part) {
         currentPart = part;
         
@@ -239,6 +349,10 @@ document.addEventListener('DOMContentLoaded', () => {
         // Check if we have an audio file for this part
         const audioKey = `${part}_audio`;
         if (!resultFiles || !resultFiles[audioKey]) {
+            // Still rendering: onJobFile sets the player up when it arrives
+            if (jobRunning) {
+                return;
+            }
             // Try to use MIDI file instead
             if (resultFiles[`${part}_midi`]) {
                 insertNotification('Audio conversion not available. Using MIDI playback which may not work in all browsers.', 'warning');
@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+"""
+Puts the repository root on sys.path so tests can import its flat modules
+however pytest is started, and points the default job database at a
+throwaway file so importing the web apps never touches jobs.db.
+"""
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_jobs_dir = tempfile.TemporaryDirectory(prefix='satb-tests-')
+os.environ['SATB_JOBS_DB'] = os.path.join(_jobs_dir.name, 'jobs.db')
@@ -0,0 +1,219 @@
+import asyncio
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from assemblyai_client import AssemblyAIClient, TranscriptionError, run_sync
+
+"""
+AssemblyAIClient against a local stub of the AssemblyAI upload, transcript
+and polling endpoints.
+"""
+
+
+class StubAssemblyAI(ThreadingHTTPServer):
+    """
+    Stores uploads and plays each transcript through a list of statuses,
+    one per poll. Uploads whose body starts with b'error' end in 'error',
+    and b'slow' ones never finish.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.url = f"http://127.0.0.1:{self.server_port}"
+        self.uploads = {}
+        self.transcripts = {}
+        self.auth = set()
+        self.delay = 0.0
+        self.in_flight = 0
+        self.peak = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def script(self, audio):
+        if audio.startswith(b'error'):
+            return ['queued', 'processing', 'error']
+        if audio.startswith(b'slow'):
+            return itertools.repeat('processing')
+        return ['queued', 'queued', 'queued', 'processing', 'processing', 'completed']
+
+    def next_id(self):
+        return str(next(self._ids))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _body(self):
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            # requests streams iterable bodies with chunked encoding
+            data = b''
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                chunk = self.rfile.read(size + 2)[:size]
+                if not size:
+                    return data
+                data += chunk
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, method):
+        stub = self.server
+        with stub._lock:
+            stub.in_flight += 1
+            stub.peak = max(stub.peak, stub.in_flight)
+            stub.auth.add(self.headers.get('authorization'))
+        try:
+            time.sleep(stub.delay)
+            body = self._body() if method == 'POST' else b''
+            if method == 'POST' and self.path == '/upload':
+                upload_id = stub.next_id()
+                stub.uploads[upload_id] = body
+                self._reply(200, {'upload_url': f"{stub.url}/files/{upload_id}"})
+            elif method == 'POST' and self.path == '/transcript':
+                audio_url = json.loads(body)['audio_url']
+                audio = stub.uploads.get(audio_url.rsplit('/', 1)[-1])
+                if audio is None:
+                    self._reply(400, {'error': 'unknown audio_url'})
+                    return
+                transcript_id = stub.next_id()
+                stub.transcripts[transcript_id] = (iter(stub.script(audio)), audio)
+                self._reply(200, {'id': transcript_id, 'status': 'queued'})
+            elif method == 'GET' and self.path.startswith('/transcript/'):
+                statuses, audio = stub.transcripts[self.path.rsplit('/', 1)[-1]]
+                status = next(statuses)
+                transcript = {'status': status, 'text': None}
+                if status == 'completed':
+                    transcript['text'] = f"heard {audio.decode()}"
+                elif status == 'error':
+                    transcript['error'] = 'Audio file could not be decoded'
+                self._reply(200, transcript)
+            else:
+                self._reply(404, {'error': 'not found'})
+        finally:
+            with stub._lock:
+                stub.in_flight -= 1
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+@pytest.fixture
+def stub():
+    server = StubAssemblyAI()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Poll delays the client asks for, without actually waiting them out."""
+    delays = []
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay, *args, **kwargs):
+        delays.append(delay)
+        await real_sleep(0)
+    monkeypatch.setattr(asyncio, 'sleep', sleep)
+    return delays
+
+
+def _client(stub, **kwargs):
+    return AssemblyAIClient(api_key='test-key', base_url=stub.url, **kwargs)
+
+
+def test_upload_file_and_stream(stub, tmp_path):
+    path = tmp_path / 'clip.wav'
+    path.write_bytes(b'from a file' * 1000)
+    client = _client(stub)
+    url = run_sync(client.upload(str(path), chunk_size=4096))
+    assert stub.uploads[url.rsplit('/', 1)[-1]] == b'from a file' * 1000
+    url = run_sync(client.upload(iter([b'streamed ', b'in ', b'chunks'])))
+    assert stub.uploads[url.rsplit('/', 1)[-1]] == b'streamed in chunks'
+    assert stub.auth == {'test-key'}
+
+
+def test_submit_rejected(stub):
+    with pytest.raises(TranscriptionError, match='unknown audio_url'):
+        run_sync(_client(stub).submit(f"{stub.url}/files/missing"))
+
+
+def test_poll_backs_off_and_resets_on_status_change(stub, sleeps):
+    client = _client(stub, poll_initial=0.25, poll_factor=1.6, poll_max=0.5)
+    statuses = []
+    text = run_sync(client.transcribe(iter([b'la la']), on_status=statuses.append))
+    assert text == 'heard la la'
+    assert statuses == ['queued', 'processing', 'completed']
+    # Three polls while queued, then back to the initial delay for processing
+    assert sleeps == pytest.approx([0.25, 0.4, 0.5, 0.25, 0.4])
+
+
+def test_error_status_raises(stub, sleeps):
+    with pytest.raises(TranscriptionError, match='could not be decoded'):
+        run_sync(_client(stub).transcribe(iter([b'error clip'])))
+
+
+def test_timeout(stub):
+    client = _client(stub, poll_initial=0.02, poll_max=0.05, timeout=0.3)
+    start = time.monotonic()
+    with pytest.raises(TranscriptionError, match='timed out'):
+        run_sync(client.transcribe(iter([b'slow clip'])))
+    assert time.monotonic() - start < 2
+
+
+def test_transcribe_many_keeps_order_and_errors(stub, sleeps):
+    results = run_sync(_client(stub).transcribe_many([iter([b'one']), iter([b'error']), iter([b'three'])]))
+    assert results[0] == 'heard one'
+    assert isinstance(results[1], TranscriptionError)
+    assert results[2] == 'heard three'
+
+
+def test_max_concurrency_holds_across_threads(stub):
+    stub.delay = 0.02
+    client = _client(stub, max_concurrency=2, poll_initial=0.01, poll_max=0.01)
+    results = []
+
+    def worker(n):
+        # Each thread runs its own event loop, like the Flask request threads
+        results.extend(run_sync(client.transcribe_many([iter([f'{n}-{i}'.encode()]) for i in range(3)])))
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == sorted(f'heard {n}-{i}' for n in range(4) for i in range(3))
+    assert stub.peak == 2
+
+
+def test_run_sync_inside_a_running_loop(stub):
+    client = _client(stub, poll_initial=0.01)
+
+    async def handler():
+        # e.g. a sync helper called from async code
+        return run_sync(client.transcribe(iter([b'nested'])))
+    assert asyncio.run(handler()) == 'heard nested'
+
+    async def failing():
+        return run_sync(client.submit(f"{stub.url}/files/missing"))
+    with pytest.raises(TranscriptionError):
+        asyncio.run(failing())
@@ -0,0 +1,140 @@
+import functools
+import io
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import assemblyai_client
+from audio_recorder import FileInputStream, RingBuffer, record_and_upload, stream_recording
+
+"""
+The streaming recorder, fed from a file by FileInputStream instead of a
+microphone, and its upload to a local stub endpoint.
+"""
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE = os.path.join(REPO_ROOT, 'recording.wav')
+DURATION = 1.5
+
+
+class StubUpload(ThreadingHTTPServer):
+    """Accepts POST /upload like AssemblyAI and keeps the request bodies."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubUploadHandler)
+        self.url = f"http://127.0.0.1:{self.server_port}"
+        self.bodies = []
+        self.chunked = []
+
+
+class StubUploadHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        chunked = self.headers.get('Transfer-Encoding') == 'chunked'
+        if chunked:
+            body = b''
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                chunk = self.rfile.read(size + 2)[:size]
+                if not size:
+                    break
+                body += chunk
+        else:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.bodies.append(body)
+        self.server.chunked.append(chunked)
+        data = json.dumps({'upload_url': f"{self.server.url}/files/{len(self.server.bodies)}"}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = StubUpload()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    monkeypatch.setattr(assemblyai_client, '_default_client',
+                        assemblyai_client.AssemblyAIClient(api_key='test-key', base_url=server.url))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _expected(samplerate=44100):
+    audio, _ = sf.read(SAMPLE, dtype='int16', always_2d=True)
+    return audio[:int(DURATION * samplerate)]
+
+
+def test_ring_buffer_wraps_around():
+    ring = RingBuffer(capacity=5, channels=2)
+    frames = np.arange(16, dtype=np.int16).reshape(8, 2)
+    ring.write(frames[:3])
+    assert np.array_equal(ring.read(), frames[:3])
+    # Starts at slot 3 and wraps past the end of the buffer
+    ring.write(frames[3:7])
+    assert np.array_equal(ring.read(), frames[3:7])
+    assert ring.overruns == 0
+    ring.close()
+    assert ring.read() is None
+
+
+def test_ring_buffer_counts_overruns():
+    ring = RingBuffer(capacity=4, channels=1)
+    ring.write(np.arange(3, dtype=np.int16).reshape(-1, 1))
+    ring.write(np.arange(3, 6, dtype=np.int16).reshape(-1, 1))
+    # The consumer fell 2 frames behind: the oldest two are dropped
+    assert ring.overruns == 2
+    assert ring.read().ravel().tolist() == [2, 3, 4, 5]
+    # More than a whole buffer in one write keeps only the newest frames
+    ring.write(np.arange(10, 20, dtype=np.int16).reshape(-1, 1))
+    assert ring.overruns == 8
+    assert ring.read().ravel().tolist() == [16, 17, 18, 19]
+
+
+def test_read_times_out_empty():
+    ring = RingBuffer(capacity=4, channels=2)
+    assert ring.read(timeout=0.01).shape == (0, 2)
+
+
+def test_stream_recording_saves_what_it_yields(tmp_path):
+    wav = str(tmp_path / 'take.wav')
+    blocks = list(stream_recording(wav, DURATION, input_stream=functools.partial(FileInputStream, SAMPLE)))
+    saved, rate = sf.read(wav, dtype='int16', always_2d=True)
+    assert rate == 44100
+    assert np.array_equal(saved, _expected())
+    assert np.array_equal(np.concatenate(blocks), saved)
+
+
+def test_record_and_upload_streams_opus(stub, tmp_path):
+    wav = str(tmp_path / 'take.wav')
+    path, audio_url = record_and_upload(wav, DURATION, input_stream=functools.partial(FileInputStream, SAMPLE))
+    assert path == os.path.abspath(wav)
+    assert audio_url == f"{stub.url}/files/1"
+    saved, _ = sf.read(wav, dtype='int16', always_2d=True)
+    assert np.array_equal(saved, _expected())
+
+    # Sent as a chunked body while recording, and a valid Ogg/Opus file
+    assert stub.chunked == [True]
+    body = stub.bodies[0]
+    assert body.startswith(b'OggS')
+    info = sf.info(io.BytesIO(body))
+    assert (info.format, info.subtype, info.channels, info.samplerate) == ('OGG', 'OPUS', 1, 16000)
+    decoded, rate = sf.read(io.BytesIO(body), dtype='float32')
+    assert abs(len(decoded) / rate - DURATION) < 0.05
+
+
+def test_file_input_stream_rejects_other_rates():
+    with pytest.raises(ValueError, match='not 16000 Hz'):
+        FileInputStream(SAMPLE, samplerate=16000, channels=2)
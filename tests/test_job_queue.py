@@ -0,0 +1,203 @@
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from job_queue import DONE, FAILED, QUEUED, RUNNING, JobQueue, JobStore, QueueFull
+
+"""
+JobQueue and JobStore against a temporary jobs database.
+"""
+
+
+def _queue(tmp_path, **kwargs):
+    # Every queue gets its own connection, like separate worker processes
+    return JobQueue(JobStore(str(tmp_path / 'jobs.db')), **kwargs)
+
+
+class Runs:
+    """Job handler that records which queue ran which job."""
+
+    def __init__(self, hold=None):
+        self.runs = []
+        self.hold = hold
+        self._lock = threading.Lock()
+
+    def handler_for(self, jobs):
+        def handler(job, **params):
+            with self._lock:
+                self.runs.append((jobs.owner, job.id))
+            if self.hold is not None:
+                self.hold.wait(10)
+            return {'files': {}}
+        return handler
+
+
+def _wait(jobs, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = jobs.status(job_id)
+        if job['status'] in (DONE, FAILED):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def _events(rows):
+    from note_events import NOTE_EVENT_DTYPE
+    events = np.zeros(rows, dtype=NOTE_EVENT_DTYPE)
+    events['onset'] = np.arange(rows)
+    events['duration'] = 1.0
+    events['midi'] = 60
+    events['velocity'] = 80
+    return events
+
+
+def test_failed_export_leaves_no_files_in_the_result(tmp_path):
+    from score_export import export_files
+
+    def export(job):
+        # The MIDI file is written and announced, then the MusicXML writer
+        # fails and export_files removes everything it wrote
+        tasks = [('score_midi', str(tmp_path / 'song.mid'), 'midi', _events(4)),
+                 ('score', str(tmp_path / 'missing' / 'song.musicxml'), 'musicxml', _events(4))]
+        return {'files': export_files(tasks, jobs=1, on_file=job.add_file)}
+
+    jobs = _queue(tmp_path)
+    jobs.register('export', export, stages=('export',))
+    job_id = jobs.submit('export')
+    stream = list(jobs.events(job_id, keepalive=0.1))
+    job = _wait(jobs, job_id)
+    assert job['status'] == FAILED
+    assert not os.path.exists(tmp_path / 'song.mid')
+    files = (job['result'] or {}).get('files', {})
+    assert [path for path in files.values() if not os.path.exists(path)] == []
+    assert stream[-1].startswith('event: failed')
+
+
+def test_job_lifecycle(tmp_path):
+    release = threading.Event()
+
+    def handler(job, name):
+        job.progress('analyse', 0.5)
+        release.wait(10)
+        job.progress('export')
+        job.add_file('score', f"{name}.musicxml")
+        return {'files': {'score': f"{name}.musicxml"}}
+
+    jobs = _queue(tmp_path)
+    jobs.register('work', handler, stages=('analyse', 'export'), weights={'analyse': 3, 'export': 1})
+    job_id = jobs.submit('work', name='song')
+    stream = jobs.events(job_id, keepalive=0.1)
+    assert next(stream).startswith('event: status')
+    deadline = time.monotonic() + 10
+    while jobs.status(job_id)['stages']['analyse']['state'] != RUNNING and time.monotonic() < deadline:
+        time.sleep(0.01)
+    running = jobs.status(job_id)
+    assert running['status'] == RUNNING
+    assert running['stages']['export']['state'] == 'pending'
+    assert 0 < running['progress'] < 1
+    # Internal bookkeeping stays out of the public view
+    assert not {'params', 'dedup_key', 'owner', 'lease'} & set(running)
+    release.set()
+    events = [message.split('\n', 1)[0] for message in stream]
+    assert 'event: file' in events
+    assert events[-1] == 'event: done'
+    job = _wait(jobs, job_id)
+    assert job['result'] == {'files': {'score': 'song.musicxml'}}
+    assert [stage['state'] for stage in job['stages'].values()] == [DONE, DONE]
+    assert job['progress'] == 1.0 and job['eta'] == 0.0
+    assert jobs.status('no-such-job') is None
+
+
+def test_queue_full(tmp_path):
+    hold = threading.Event()
+    runs = Runs(hold)
+    jobs = _queue(tmp_path, workers=1, max_pending=2)
+    jobs.register('work', runs.handler_for(jobs))
+    first = jobs.submit('work')
+    jobs.submit('work')
+    with pytest.raises(QueueFull):
+        jobs.submit('work')
+    hold.set()
+    _wait(jobs, first)
+    deadline = time.monotonic() + 10
+    while len(runs.runs) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # Finished jobs free their slots
+    _wait(jobs, jobs.submit('work'))
+
+
+def test_expired_job_is_taken_over_by_exactly_one_queue(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.db'))
+    # Owned by a process that died with the job running
+    orphan = store.create('work', {}, ('analyse',), owner='gone:1:dead', lease=time.time() - 1)
+    store.update(orphan['id'], status=RUNNING)
+
+    runs = Runs()
+    queues = [_queue(tmp_path) for _ in range(4)]
+    for jobs in queues:
+        jobs.register('work', runs.handler_for(jobs))
+    start = threading.Barrier(len(queues))
+
+    def recover(jobs):
+        start.wait()
+        jobs.status(orphan['id'])
+    threads = [threading.Thread(target=recover, args=(jobs,)) for jobs in queues]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    job = _wait(queues[0], orphan['id'])
+    assert job['status'] == DONE
+    assert len(runs.runs) == 1
+    assert store.get(orphan['id'])['owner'] == runs.runs[0][0]
+
+
+def test_live_owner_keeps_its_job(tmp_path):
+    hold = threading.Event()
+    runs = Runs(hold)
+    owner = _queue(tmp_path, lease=0.3)
+    owner.register('work', runs.handler_for(owner))
+    job_id = owner.submit('work')
+    other = _queue(tmp_path, lease=0.3)
+    other.register('work', runs.handler_for(other))
+    other.status(job_id)
+    # Several leases go by: the owner's heartbeat renews, the other queue's keeps checking
+    time.sleep(1.2)
+    hold.set()
+    assert _wait(owner, job_id)['status'] == DONE
+    assert runs.runs == [(owner.owner, job_id)]
+
+
+def test_old_schema_is_migrated(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    conn = sqlite3.connect(path)
+    # The table as it was before deduplication and leases
+    conn.execute(
+        "CREATE TABLE jobs ("
+        " id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL,"
+        " params TEXT NOT NULL, stages TEXT NOT NULL, result TEXT, error TEXT,"
+        " created REAL NOT NULL, updated REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO jobs VALUES ('legacy', 'work', ?, '{}', ?, NULL, NULL, 1, 1)",
+                 (QUEUED, '{"analyse": {"state": "pending"}}'))
+    conn.execute("INSERT INTO jobs VALUES ('finished', 'work', ?, '{}', '{}', '{\"files\": {}}', NULL, 1, 1)",
+                 (DONE,))
+    conn.commit()
+    conn.close()
+
+    runs = Runs()
+    jobs = _queue(tmp_path)
+    jobs.register('work', runs.handler_for(jobs))
+    columns = {row[1] for row in sqlite3.connect(path).execute("PRAGMA table_info(jobs)")}
+    assert {'dedup_key', 'owner', 'lease'} <= columns
+    # The legacy job has no owner or lease, so it counts as expired and is restarted once
+    assert _wait(jobs, 'legacy')['status'] == DONE
+    assert _wait(jobs, 'finished')['result'] == {'files': {}}
+    assert runs.runs == [(jobs.owner, 'legacy')]
+    # Opening the migrated database again changes nothing
+    assert JobStore(path).get('legacy')['status'] == DONE
@@ -0,0 +1,54 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+import score_export
+from note_events import NOTE_EVENT_DTYPE
+from score_export import export_files
+
+"""
+The shared MusicXML export pool: reuse across exports, idle shutdown and
+the timing line.
+"""
+
+
+def _tasks(folder, tag, musicxml=2):
+    events = np.zeros(8, dtype=NOTE_EVENT_DTYPE)
+    events['onset'] = np.arange(8)
+    events['duration'] = 1.0
+    events['midi'] = 60
+    events['velocity'] = 80
+    tasks = [(f"{tag}_midi", str(folder / f"{tag}.mid"), 'midi', events)]
+    return tasks + [(f"{tag}_{i}", str(folder / f"{tag}_{i}.musicxml"), 'musicxml', events) for i in range(musicxml)]
+
+
+@pytest.fixture
+def idle(monkeypatch):
+    monkeypatch.setattr(score_export, 'EXPORT_POOL_IDLE', 0.5)
+    yield
+    score_export._shutdown_pool()
+
+
+def test_in_process_export_reports_no_savings(tmp_path, capsys):
+    written = export_files(_tasks(tmp_path, 'solo'), jobs=1)
+    assert all(os.path.exists(path) for path in written.values())
+    line = capsys.readouterr().out.strip().splitlines()[-1]
+    assert line.endswith('in this process') and 'saved' not in line
+
+
+def test_pool_is_reused_then_shut_down_when_idle(tmp_path, idle):
+    export_files(_tasks(tmp_path, 'first'), jobs=2)
+    pool = score_export._export_pool
+    workers = list(pool._processes.values())
+    export_files(_tasks(tmp_path, 'second'), jobs=2)
+    assert score_export._export_pool is pool
+    deadline = time.monotonic() + 10
+    while any(process.is_alive() for process in workers) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert score_export._export_pool is None
+    assert not any(process.is_alive() for process in workers)
+    # The next export starts a fresh pool
+    written = export_files(_tasks(tmp_path, 'third'), jobs=2)
+    assert all(os.path.exists(path) for path in written.values())
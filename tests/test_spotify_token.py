@@ -0,0 +1,158 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import spotify_query
+from get_acces_token import SpotifyTokenProvider
+from spotify_query import search_track
+
+"""
+SpotifyTokenProvider and the search path against a local stub of the
+Spotify token and search endpoints.
+"""
+
+
+class StubSpotify(ThreadingHTTPServer):
+    """Issues token-1, token-2, ... and only accepts the newest token for search."""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.url = f"http://127.0.0.1:{self.server_port}"
+        self.expires_in = 3600
+        self.token_status = 200
+        self.token_delay = 0.0
+        self.token_requests = 0
+        self.search_tokens = []
+        self._lock = threading.Lock()
+
+    def issue_token(self):
+        with self._lock:
+            self.token_requests += 1
+            return f"token-{self.token_requests}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        stub = self.server
+        form = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        assert form == {'grant_type': ['client_credentials']}
+        assert self.headers['Authorization'].startswith('Basic ')
+        time.sleep(stub.token_delay)
+        token = stub.issue_token()
+        if stub.token_status != 200:
+            self._reply(stub.token_status, {'error': 'invalid_client'})
+        else:
+            self._reply(200, {'access_token': token, 'token_type': 'Bearer', 'expires_in': stub.expires_in})
+
+    def do_GET(self):
+        stub = self.server
+        token = self.headers['Authorization'].split(' ', 1)[1]
+        stub.search_tokens.append(token)
+        if token != f"token-{stub.token_requests}":
+            self._reply(401, {'error': {'status': 401, 'message': 'The access token expired'}})
+            return
+        query = parse_qs(urlparse(self.path).query)['q'][0]
+        self._reply(200, {'tracks': {'items': [{'id': query, 'name': query}]}})
+
+
+@pytest.fixture
+def stub():
+    server = StubSpotify()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _provider(stub, refresh_margin=60):
+    return SpotifyTokenProvider('client', 'secret', refresh_margin=refresh_margin, url=stub.url + '/api/token')
+
+
+def test_token_is_cached(stub):
+    provider = _provider(stub)
+    assert provider.get_token() == 'token-1'
+    assert provider.get_token() == 'token-1'
+    assert stub.token_requests == 1
+
+
+def test_token_is_refreshed_before_expiry(stub):
+    stub.expires_in = 60
+    provider = _provider(stub, refresh_margin=60)
+    assert provider.get_token() == 'token-1'
+    # Already within the refresh margin, so the next call refreshes
+    assert provider.get_token() == 'token-2'
+
+
+def test_concurrent_callers_share_one_refresh(stub):
+    stub.token_delay = 0.2
+    provider = _provider(stub)
+    tokens = []
+    threads = [threading.Thread(target=lambda: tokens.append(provider.get_token())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert tokens == ['token-1'] * 8
+    assert stub.token_requests == 1
+
+
+def test_failed_refresh_returns_none(stub):
+    stub.token_status = 401
+    assert _provider(stub).get_token() is None
+
+
+def test_invalidate_only_drops_the_rejected_token(stub):
+    provider = _provider(stub)
+    provider.get_token()
+    provider.invalidate('token-1')
+    assert provider.get_token() == 'token-2'
+    # A late 401 for the old token must not discard the new one
+    provider.invalidate('token-1')
+    assert provider.get_token() == 'token-2'
+    assert stub.token_requests == 2
+
+
+def test_search_retries_once_with_a_fresh_token_after_401(stub, monkeypatch):
+    monkeypatch.setattr(spotify_query, 'SEARCH_ENDPOINT', stub.url + '/v1/search')
+    provider = _provider(stub)
+    stale = provider.get_token()
+    # The API has since revoked the cached token
+    stub.issue_token()
+    tracks = search_track(['first query', 'second query'], stale, return_results=True,
+                          use_cache=False, token_provider=provider)
+    assert sorted(track['id'] for track in tracks) == ['first query', 'second query']
+    # Both variants got a 401, but only one of them refreshed the token
+    assert stub.token_requests == 3
+    assert stub.search_tokens.count(stale) == 2
+    assert stub.search_tokens.count('token-3') == 2
+
+
+def test_search_without_provider_does_not_retry(stub, monkeypatch):
+    monkeypatch.setattr(spotify_query, 'SEARCH_ENDPOINT', stub.url + '/v1/search')
+    assert search_track('query', 'revoked', return_results=True, use_cache=False) == []
+    assert stub.search_tokens == ['revoked']
+
+
+def test_missing_query_is_a_failed_search(stub, monkeypatch):
+    monkeypatch.setattr(spotify_query, 'SEARCH_ENDPOINT', stub.url + '/v1/search')
+    # transcriber() returns None when the transcript errors or times out
+    assert search_track(None, 'token', return_results=True) == []
+    assert search_track(None, 'token') is None
+    assert search_track(['', ''], 'token', return_results=True) == []
+    assert stub.search_tokens == []
@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+"""
+Startup regression test: a cold `import app` must stay fast and must not
+load the audio/scientific stack, which is imported on first use.
+"""
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds for a fresh interpreter to `import app` (about 0.3 s on a laptop;
+# the heavy stack alone adds several seconds on a cold disk)
+IMPORT_BUDGET = float(os.getenv('SATB_IMPORT_BUDGET', '1.5'))
+
+DEFERRED_MODULES = ('librosa', 'music21', 'numpy', 'soundfile', 'sounddevice')
+
+
+def _import_app():
+    """Import app in a fresh interpreter; returns (wall seconds, modules loaded of DEFERRED_MODULES)."""
+    check = f"import sys, app; print(','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))"
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, SATB_JOBS_DB=os.path.join(tmp, 'jobs.db'))
+        start = time.perf_counter()
+        done = subprocess.run([sys.executable, '-c', check], cwd=REPO_ROOT, env=env,
+                              capture_output=True, text=True, timeout=60)
+        elapsed = time.perf_counter() - start
+    assert done.returncode == 0, done.stderr
+    return elapsed, [m for m in done.stdout.strip().split(',') if m]
+
+
+def test_import_app_within_budget():
+    # Best of three, so one slow run on a busy machine doesn't fail the test
+    elapsed = min(_import_app()[0] for _ in range(3))
+    assert elapsed < IMPORT_BUDGET, f"`import app` took {elapsed:.2f}s (budget {IMPORT_BUDGET}s)"
+
+
+def test_import_app_defers_heavy_modules():
+    _, loaded = _import_app()
+    assert loaded == [], f"`import app` loaded {loaded}"
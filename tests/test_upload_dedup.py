@@ -0,0 +1,115 @@
+import io
+import os
+import threading
+import time
+
+import pytest
+
+from job_queue import DONE, FAILED, JobQueue, JobStore
+
+"""
+Upload deduplication in app.py: content-addressed storage (upload_store)
+and job reuse keyed on the content hash plus the quality tier.
+"""
+
+AUDIO = b'ID3' + bytes(range(256)) * 64
+
+
+class StubPipeline:
+    """Stands in for process_upload: writes one output per run, or fails on request."""
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.runs = []
+        self.fail = False
+        self._lock = threading.Lock()
+
+    def __call__(self, job, file_path, filename, quality):
+        with self._lock:
+            self.runs.append((file_path, quality))
+            run = len(self.runs)
+        if self.fail:
+            raise RuntimeError('transcription failed')
+        output = os.path.join(self.out_dir, f"run{run}.mp3")
+        with open(output, 'wb') as f:
+            f.write(b'audio')
+        return {'files': {'score_audio': output}}
+
+
+@pytest.fixture
+def upload(tmp_path, monkeypatch):
+    import app as app_module
+
+    uploads = tmp_path / 'uploads'
+    uploads.mkdir()
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_FOLDER', str(uploads))
+    monkeypatch.setitem(app_module.app.config, 'AUDIO_FOLDER', str(tmp_path))
+    jobs = JobQueue(JobStore(str(tmp_path / 'jobs.db')))
+    pipeline = StubPipeline(str(tmp_path))
+    jobs.register('satb_upload', pipeline)
+    monkeypatch.setattr(app_module, 'jobs', jobs)
+    client = app_module.app.test_client()
+
+    def post(name, data=AUDIO, quality='fast'):
+        """Upload and wait for the job; returns (response JSON, final job)."""
+        response = client.post('/upload', data={'file': (io.BytesIO(data), name), 'quality': quality},
+                               content_type='multipart/form-data')
+        assert response.status_code in (200, 202), response.get_json()
+        body = response.get_json()
+        deadline = time.monotonic() + 10
+        while jobs.status(body['job_id'])['status'] not in (DONE, FAILED):
+            assert time.monotonic() < deadline, 'job did not finish'
+            time.sleep(0.01)
+        return body, jobs.status(body['job_id'])
+
+    post.uploads = uploads
+    post.pipeline = pipeline
+    return post
+
+
+def test_same_bytes_under_two_names_share_file_and_job(upload):
+    first, job = upload('choir.mp3')
+    second, _ = upload('Copy of choir.mp3')
+    assert second['job_id'] == first['job_id']
+    assert second['status'] == DONE and second['files'] == job['result']['files']
+    stored = [name for name in os.listdir(upload.uploads) if not name.endswith('.part')]
+    assert len(stored) == 1 and stored[0].startswith('choir_')
+    assert len(upload.pipeline.runs) == 1
+
+
+def test_different_bytes_with_one_name_are_kept_apart(upload):
+    first, _ = upload('choir.mp3')
+    second, _ = upload('choir.mp3', data=AUDIO + b'more')
+    assert second['job_id'] != first['job_id']
+    assert len(os.listdir(upload.uploads)) == 2
+    assert len({path for path, _ in upload.pipeline.runs}) == 2
+
+
+def test_other_quality_is_a_new_job(upload):
+    first, _ = upload('choir.mp3', quality='fast')
+    second, _ = upload('choir.mp3', quality='accurate')
+    assert second['job_id'] != first['job_id']
+    assert [quality for _, quality in upload.pipeline.runs] == ['fast', 'accurate']
+    assert len(os.listdir(upload.uploads)) == 1
+
+
+def test_finished_job_is_reused_only_while_its_files_exist(upload):
+    first, job = upload('choir.mp3')
+    again, _ = upload('choir.mp3')
+    assert again['job_id'] == first['job_id'] and again['status'] == DONE
+    os.unlink(job['result']['files']['score_audio'])
+    rerun, rerun_job = upload('choir.mp3')
+    assert rerun['job_id'] != first['job_id']
+    assert rerun_job['status'] == DONE
+    assert len(upload.pipeline.runs) == 2
+
+
+def test_failed_job_is_never_reused(upload):
+    upload.pipeline.fail = True
+    first, job = upload('choir.mp3')
+    assert job['status'] == FAILED
+    upload.pipeline.fail = False
+    second, job = upload('choir.mp3')
+    assert second['job_id'] != first['job_id']
+    assert job['status'] == DONE
+    assert len(upload.pipeline.runs) == 2
@@ -1,44 +1,33 @@
-import requests
-import time
-import os
-
+from assemblyai_client import TranscriptionError, get_client, run_sync
 
 
 def transcriber(audio_url):
+    """
+    Transcribe an uploaded audio URL with AssemblyAI.
 
-    # 1. Submit transcription request
-    headers = {"authorization": os.getenv('API_KEY')}
-    transcript_request = {"audio_url": audio_url}
-
-    response = requests.post(
-        "https://api.assemblyai.com/v2/transcript",
-        json=transcript_request,
-        headers=headers
-    )
+    Blocking wrapper around AssemblyAIClient, which polls with backoff
+    instead of a fixed interval.
 
-    if response.status_code != 200:
-        raise Exception("Transcription request failed:", response.text)
+    Returns:
+        str: Transcript text, or None if the transcription failed
+    """
+    client = get_client()
 
-    transcript_id = response.json()['id']
+    # 1. Submit transcription request (raises TranscriptionError if rejected)
+    transcript_id = run_sync(client.submit(audio_url))
     print("Transcript ID:", transcript_id)
 
     # 2. Poll for completion
-    polling_endpoint = f"https://api.assemblyai.com/v2/transcript/{transcript_id}"
-
-    while True:
-        polling_response = requests.get(polling_endpoint, headers=headers)
-        status = polling_response.json()['status']
-
-        if status == 'completed':
-            print("\n🎧 Transcription Result:\n")
-            print(polling_response.json()['text'])
-            break
-        elif status == 'error':
-            print("❌ Error:", polling_response.json()['error'])
-            break
-        else:
-            print("⏳ Status:", status)
-            time.sleep(3)
-
-    music_text = polling_response.json()['text']
+    def on_status(status):
+        print("⏳ Status:", status)
+
+    try:
+        transcript = run_sync(client.wait(transcript_id, on_status))
+    except TranscriptionError as e:
+        print("❌ Error:", e)
+        return None
+
+    music_text = transcript['text']
+    print("\n🎧 Transcription Result:\n")
+    print(music_text)
     return music_text
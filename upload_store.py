@@ -0,0 +1,54 @@
+import glob
+import hashlib
+import os
+import tempfile
+
+"""
+Content-addressed storage for uploaded audio.
+
+The request body is hashed (SHA-256, as analysis_cache.file_hash) while it
+is streamed to disk, so there is no second pass over the file. Files are
+stored as ``<name>_<hash prefix><ext>``: the same recording uploaded again,
+under any name, maps to the copy already on disk, and different recordings
+that share a filename never overwrite each other. The digest is what the
+web apps deduplicate jobs on.
+"""
+
+CHUNK_SIZE = 1 << 20
+HASH_PREFIX = 12
+
+
+def save_upload(file, folder, filename, chunk_size=CHUNK_SIZE):
+    """
+    Stream an uploaded file into ``folder``, hashing it on the way.
+
+    Args:
+        file: werkzeug FileStorage (anything with a readable ``.stream``)
+        folder (str): Upload directory
+        filename (str): Sanitised client filename, used for the stored name
+        chunk_size (int): Bytes read per chunk
+
+    Returns:
+        tuple: (SHA-256 hex digest, path of the stored file)
+    """
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: file.stream.read(chunk_size), b''):
+                digest.update(chunk)
+                out.write(chunk)
+        stem, ext = os.path.splitext(filename)
+        tag = digest.hexdigest()[:HASH_PREFIX]
+        existing = glob.glob(os.path.join(glob.escape(folder), f"*_{tag}{ext}"))
+        if existing:
+            # Already have this recording (possibly under another name)
+            os.unlink(tmp_path)
+            return digest.hexdigest(), existing[0]
+        path = os.path.join(folder, f"{stem}_{tag}{ext}")
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return digest.hexdigest(), path
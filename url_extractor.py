@@ -1,20 +1,48 @@
-import requests
 import os
+import time
 
-def url_extractor(audio_path):
-    # Upload audio
-    upload_url = "https://api.assemblyai.com/v2/upload"
-    headers = {"authorization": os.getenv('API_KEY')}
+from assemblyai_client import TranscriptionError, get_client, run_sync
 
-    with open(audio_path, 'rb') as f:
-        response = requests.post(upload_url, headers=headers, data=f)
 
-    print(response.status_code, response.text)
+def _counted(chunks, stats):
+    for chunk in chunks:
+        stats['bytes'] += len(chunk)
+        yield chunk
 
-    # Extract URL
-    if response.status_code == 200:
-        audio_url = response.json()['upload_url']
-    else:
+
+def url_extractor(audio_path, compress='flac'):
+    """
+    Upload audio to AssemblyAI.
+
+    Args:
+        audio_path (str): Audio file to upload
+        compress (str): 'flac' (lossless) or 'opus' (smallest, slower to
+            encode) to downmix to 16 kHz mono before uploading; None to
+            upload the file as is
+
+    Returns:
+        str: upload_url for transcriber()
+    """
+    original_size = os.path.getsize(audio_path)
+    stats = {'bytes': 0}
+    body = audio_path
+    if compress:
+        # Imported here so importing this module doesn't pull in soundfile/soxr
+        from speech_encoder import can_encode, encode_speech
+        if can_encode(audio_path):
+            body = _counted(encode_speech(audio_path, compress), stats)
+        else:
+            print(f"Can't decode {audio_path}, uploading it uncompressed")
+
+    # Upload audio, streamed in chunks
+    start = time.perf_counter()
+    try:
+        audio_url = run_sync(get_client().upload(body))
+    except TranscriptionError as e:
+        print(e)
         raise Exception("Upload failed")
+    elapsed = time.perf_counter() - start
 
+    uploaded = stats['bytes'] if body is not audio_path else original_size
+    print(f"Uploaded {uploaded / 1024:.0f} KB (from {original_size / 1024:.0f} KB) in {elapsed:.2f}s")
     return audio_url
@@ -0,0 +1,218 @@
+from itertools import combinations
+
+import numpy as np
+
+"""
+SATB voice assignment over the whole onset sequence.
+
+At every onset each voice either sings one of the detected candidate
+pitches or rests. Voices never cross: with candidates sorted high to low,
+soprano, alto, tenor and bass take candidates in that order. That leaves
+at most 70 assignments ("states") per onset for four candidates. A
+Viterbi pass picks the cheapest path of states through the song, trading
+off:
+
+- dropping a detected pitch (stronger candidates cost more to drop),
+- a voice resting,
+- the leap each voice makes from the previous onset.
+
+Costs and valid states for every onset are computed in one NumPy pass;
+the sequential recursion runs in a numba kernel (numba ships with
+librosa) that skips invalid states, with a NumPy fallback.
+"""
+
+REST = -1
+
+DROP_COST = 8.0      # leaving a candidate unsung; the strongest costs this plus 1 per rank above the weakest
+REST_COST = 1.0      # a voice resting at an onset
+LEAP_COST = 0.5      # per semitone a voice moves between consecutive onsets
+MAX_LEAP = 12        # leaps are charged up to an octave, so a big jump never outweighs a dropped note
+
+
+def _states(n_voices, n_candidates):
+    """(n_states, n_voices) candidate index per voice, REST for silent voices, never crossing."""
+    states = []
+    for sung in range(n_voices + 1):
+        for voices in combinations(range(n_voices), sung):
+            for picks in combinations(range(n_candidates), sung):
+                state = [REST] * n_voices
+                for voice, pick in zip(voices, picks):
+                    state[voice] = pick
+                states.append(state)
+    return np.array(states, dtype=np.int64)
+
+
+def greedy_assignment(candidates, ranges):
+    """
+    Assign each onset independently: the highest candidate goes to the
+    highest voice whose range contains it, and so on down.
+
+    Args:
+        candidates (np.ndarray): (n_onsets, k) MIDI candidates, -1 padded
+        ranges (list): (lowest, highest) MIDI pitch per voice, top voice first
+
+    Returns:
+        np.ndarray: (n_voices, n_onsets) int8 MIDI pitches, REST where silent
+    """
+    candidates = np.asarray(candidates, dtype=np.int8)
+    # Highest candidate first; -1 padding sorts to the end
+    ordered = np.sort(candidates, axis=1)[:, ::-1]
+    midi = np.full((len(ranges), len(candidates)), REST, dtype=np.int8)
+    for pitch in ordered.T:
+        placed = pitch < 0
+        for v, (low, high) in enumerate(ranges):
+            take = ~placed & (midi[v] == REST) & (pitch >= low) & (pitch <= high)
+            midi[v, take] = pitch[take]
+            placed |= take
+    return midi
+
+
+def viterbi_assignment(candidates, ranges, block_size=256):
+    """
+    Assign candidates to voices with a Viterbi pass over all onsets.
+
+    Args:
+        candidates (np.ndarray): (n_onsets, k) MIDI candidates, strongest
+            first, -1 padded
+        ranges (list): (lowest, highest) MIDI pitch per voice, top voice first
+        block_size (int): Onsets per block of transition costs (NumPy fallback only)
+
+    Returns:
+        np.ndarray: (n_voices, n_onsets) int8 MIDI pitches, REST where silent
+    """
+    candidates = np.asarray(candidates, dtype=np.int64)
+    n, k = candidates.shape
+    n_voices = len(ranges)
+    if n == 0:
+        return np.full((n_voices, 0), REST, dtype=np.int8)
+    states = _states(n_voices, k)
+
+    # Sort candidates high to low, keeping each one's strength rank
+    order = np.argsort(-candidates, axis=1, kind='stable')
+    ordered = np.take_along_axis(candidates, order, axis=1)
+    drop_cost = np.where(ordered >= 0, DROP_COST + (k - 1 - order), 0.0)
+
+    # Pitch every voice sings in every state at every onset: (n, n_states, n_voices)
+    padded = np.concatenate([ordered, np.full((n, 1), REST)], axis=1)
+    pitch = padded[:, states].astype(np.int16)
+    sung = states >= 0
+    low = np.array([r[0] for r in ranges])
+    high = np.array([r[1] for r in ranges])
+    valid = np.all(~sung | ((pitch >= low) & (pitch <= high)), axis=2)
+
+    # Emission: every state pays for the candidates it leaves out and the voices that rest
+    used = np.zeros((len(states), k + 1), dtype=bool)
+    np.put_along_axis(used, np.where(sung, states, k), True, axis=1)
+    emission = drop_cost.sum(axis=1, keepdims=True) - drop_cost @ used[:, :k].T.astype(float)
+    emission += REST_COST * (~sung).sum(axis=1)
+    emission[~valid] = np.inf
+
+    path = _viterbi(states, padded, pitch, emission, block_size)
+    return pitch[np.arange(n), path].T.astype(np.int8)
+
+
+def _viterbi_numpy(pitch, emission, block_size):
+    """Viterbi recursion with NumPy: dense transition costs per block of onsets."""
+    n, n_states = emission.shape
+    cost = emission[0].copy()
+    back = np.zeros((n, n_states), dtype=np.int16)
+    for block_start in range(1, n, block_size):
+        block = slice(block_start, min(n, block_start + block_size))
+        # (block, prev state, state): summed leaps of the voices sung at both onsets
+        prev, cur = pitch[block_start - 1:block.stop - 1, :, None, :], pitch[block, None, :, :]
+        leap = np.minimum(np.abs(cur - prev), MAX_LEAP)
+        transition = LEAP_COST * np.where((prev >= 0) & (cur >= 0), leap, 0).sum(axis=3)
+        for t, step in zip(range(block.start, block.stop), transition):
+            total = cost[:, None] + step
+            back[t] = total.argmin(axis=0)
+            cost = total.min(axis=0) + emission[t]
+    return _backtrack(cost, back)
+
+
+def _backtrack(cost, back):
+    """Cheapest state per onset, following back pointers from the final costs."""
+    path = np.empty(len(back), dtype=np.int64)
+    path[-1] = cost.argmin()
+    for t in range(len(back) - 1, 0, -1):
+        path[t - 1] = back[t, path[t]]
+    return path
+
+
+def _viterbi_kernel(states, slot_pitch, emission, valid_ptr, valid_states, leap_cost, max_leap):
+    """
+    Viterbi recursion over the valid states of each onset.
+
+    Leaps only depend on which candidate slot (or rest) a voice takes at two
+    consecutive onsets, so they come from a small slot-by-slot table instead
+    of being recomputed for every pair of states. No transition costs more than
+    n_voices * leap_cost * max_leap, so previous states that far behind the
+    cheapest one can never be the best predecessor and are skipped.
+    """
+    n, n_slots = slot_pitch.shape
+    n_states, n_voices = states.shape
+    cost = np.full(n_states, np.inf)
+    for i in range(valid_ptr[0], valid_ptr[1]):
+        cost[valid_states[i]] = emission[0, valid_states[i]]
+    back = np.zeros((n, n_states), dtype=np.int16)
+    new_cost = np.full(n_states, np.inf)
+    leap = np.zeros((n_slots, n_slots))
+    max_step = n_voices * leap_cost * max_leap
+    alive = np.empty(n_states, dtype=np.int64)
+    for t in range(1, n):
+        # Previous states still able to win
+        floor = np.inf
+        for j in range(valid_ptr[t - 1], valid_ptr[t]):
+            floor = min(floor, cost[valid_states[j]])
+        n_alive = 0
+        for j in range(valid_ptr[t - 1], valid_ptr[t]):
+            if cost[valid_states[j]] <= floor + max_step:
+                alive[n_alive] = valid_states[j]
+                n_alive += 1
+        for a in range(n_slots):
+            for b in range(n_slots):
+                pa, pb = slot_pitch[t - 1, a], slot_pitch[t, b]
+                leap[a, b] = leap_cost * min(abs(pb - pa), max_leap) if pa >= 0 and pb >= 0 else 0.0
+        for i in range(valid_ptr[t], valid_ptr[t + 1]):
+            s = valid_states[i]
+            best, best_p = np.inf, 0
+            for j in range(n_alive):
+                p = alive[j]
+                total = cost[p]
+                for v in range(n_voices):
+                    total += leap[states[p, v], states[s, v]]
+                if total < best:
+                    best, best_p = total, p
+            new_cost[s] = best + emission[t, s]
+            back[t, s] = best_p
+        for j in range(valid_ptr[t - 1], valid_ptr[t]):
+            cost[valid_states[j]] = np.inf
+        for i in range(valid_ptr[t], valid_ptr[t + 1]):
+            cost[valid_states[i]] = new_cost[valid_states[i]]
+    return cost, back
+
+
+_compiled_kernel = None
+
+
+def _get_kernel():
+    """numba-compiled Viterbi kernel, built on first use; None without numba."""
+    global _compiled_kernel
+    if _compiled_kernel is None:
+        try:
+            import numba
+            _compiled_kernel = numba.njit(cache=True, nogil=True)(_viterbi_kernel)
+        except ImportError:
+            _compiled_kernel = False
+    return _compiled_kernel or None
+
+
+def _viterbi(states, padded, pitch, emission, block_size):
+    kernel = _get_kernel()
+    if kernel is None:
+        return _viterbi_numpy(pitch, emission, block_size)
+    # Valid states of every onset as one flat list (CSR layout)
+    onset, valid_states = np.nonzero(np.isfinite(emission))
+    valid_ptr = np.searchsorted(onset, np.arange(len(emission) + 1))
+    slots = np.where(states >= 0, states, padded.shape[1] - 1)
+    cost, back = kernel(slots, padded, emission, valid_ptr, valid_states, LEAP_COST, MAX_LEAP)
+    return _backtrack(cost, back)
@@ -1,13 +1,19 @@
-from flask import Flask, render_template, request, send_from_directory, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response
 import os
-import uuid
+import json
+import tempfile
 from werkzeug.utils import secure_filename
-from SATB_generator import generate_satb_parts
+from SATB_generator import generate_satb_parts, QUALITY_TIERS
+from job_queue import JobQueue, QueueFull
+from upload_store import save_upload
+from file_serving import send_result
 import requests
 
 UPLOAD_FOLDER = 'uploads'
 RESULTS_FOLDER = 'results'
 ALLOWED_EXTENSIONS = {'mp3', 'webm', 'wav', 'ogg'}
+OUTPUT_FORMATS = ('musicxml', 'midi', 'pdf')
+SOLFEGE_SYSTEMS = ('fixed', 'movable')
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
@@ -68,15 +74,27 @@ def api_match():
     file = request.files.get('audio') or request.files.get('file')
     if not file or not allowed_file(file.filename):
         return jsonify({'error': 'No valid audio uploaded'}), 400
-    # Save with a unique name to avoid collisions
-    ext = os.path.splitext(file.filename)[1]
-    unique_name = f"recording_{uuid.uuid4().hex}{ext}"
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_name)
-    file.save(filepath)
-    # --- Use general audio recognition (cloud API) ---
-    match_info = recognize_audio_with_spotify_or_general(filepath)
+    # Saved under its content hash (computed while streaming to disk), so the
+    # same recording uploaded again shares one file and one recognition result
+    ext = os.path.splitext(file.filename)[1].lower()
+    digest, filepath = save_upload(file, app.config['UPLOAD_FOLDER'], f"recording{ext}")
+    unique_name = os.path.basename(filepath)
+    match_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{digest}.match.json")
+    if os.path.exists(match_path):
+        with open(match_path) as f:
+            match_info = json.load(f)
+    else:
+        # --- Use general audio recognition (cloud API) ---
+        match_info = recognize_audio_with_spotify_or_general(filepath)
+        # Only matches are cached: no match may be an API error, timeout or missing
+        # token, so the next request for the same recording tries again
+        if match_info:
+            with tempfile.NamedTemporaryFile('w', dir=app.config['UPLOAD_FOLDER'], suffix='.part', delete=False) as f:
+                json.dump(match_info, f)
+            os.replace(f.name, match_path)
     if not match_info:
-        os.remove(filepath)
+        # The stored copy is shared by content hash (possibly with an /upload
+        # job in app.py), so it is kept rather than deleted here
         return jsonify({'match': None})
     # Optionally, return Spotify info for frontend display
     return jsonify({'match': match_info['title'], 'artist': match_info.get('artist'), 'spotify': match_info.get('spotify'), 'filename': unique_name})
@@ -87,18 +105,61 @@ def api_generate():
     filename = request.form.get('filename')
     output_format = request.form.get('format', 'musicxml')
     solfege = request.form.get('solfege', 'fixed')
+    quality = request.form.get('quality', 'accurate')
     if not filename:
         return jsonify({'error': 'No file provided'}), 400
+    if quality not in QUALITY_TIERS:
+        return jsonify({'error': f"Unknown quality '{quality}'"}), 400
+    # Both end up in the output file names
+    if output_format not in OUTPUT_FORMATS:
+        return jsonify({'error': f"Unknown format '{output_format}'"}), 400
+    if solfege not in SOLFEGE_SYSTEMS:
+        return jsonify({'error': f"Unknown solfege system '{solfege}'"}), 400
     filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     if not os.path.exists(filepath):
         return jsonify({'error': 'File not found'}), 404
+    # Uploads are stored by content hash, so the filename plus settings identifies
+    # the work: attach to a running job or return a finished one's results
+    try:
+        job_id = jobs.submit('satb_generate', dedup_key=f"{filename}:{output_format}:{solfege}:{quality}",
+                             reusable=generated_outputs_exist, filepath=filepath,
+                             output_format=output_format, solfege=solfege, quality=quality)
+    except QueueFull:
+        return jsonify({'error': 'Server busy, please try again shortly'}), 503
+    job = jobs.status(job_id)
+    if job['status'] == 'done':
+        return jsonify({**with_download_urls(job['result']), 'job_id': job_id, 'status': 'done'})
+    return jsonify({'job_id': job_id, 'status_url': url_for('job_status', job_id=job_id),
+                    'events_url': url_for('job_events', job_id=job_id)}), 202
+
+def generated_outputs_exist(result):
+    """Whether a finished /api/generate job's files are all still on disk."""
+    paths = [link['path'] for link in result['download_links']]
+    if result['pdf_link']:
+        paths.append(result['pdf_link'])
+    return all(os.path.exists(os.path.join(app.config['RESULTS_FOLDER'], path)) for path in paths)
+
+def with_download_urls(result):
+    # While running, the result only lists the files written so far
+    for link in result.get('download_links', ()):
+        link['url'] = url_for('download_file', filename=link['path'])
+    return result
+
+def generate_job(job, filepath, output_format, solfege, quality):
+    """Job handler for /api/generate; links are turned into URLs by job_status."""
     outputs = generate_satb_parts(
         [filepath],
         output_dir=app.config['RESULTS_FOLDER'],
         output_format=output_format,
         solfege_system=solfege,
         export_audio=True,
-        play_midi=False
+        play_midi=False,
+        quality=quality,
+        progress=job.progress,
+        on_file=lambda part, path: job.add_file(part, os.path.relpath(path, app.config['RESULTS_FOLDER'])),
+        # One set of files per dedup key, so runs with other settings cannot
+        # overwrite the files a finished job's result points to
+        name_suffix=f"_{output_format}_{solfege}_{quality}"
     )
     download_links = []
     pdf_link = None
@@ -108,12 +169,33 @@ def api_generate():
             if part == 'score' and output_format == 'pdf':
                 pdf_link = rel_path
             else:
-                download_links.append({'part': part, 'url': url_for('download_file', filename=rel_path)})
-    return jsonify({'download_links': download_links, 'pdf_link': pdf_link})
+                download_links.append({'part': part, 'path': rel_path})
+    return {'download_links': download_links, 'pdf_link': pdf_link}
+
+jobs = JobQueue()
+# Job stages in order, weighted by their share of a typical 'accurate' run
+GENERATE_STAGES = {'decode': 4, 'onset': 0.5, 'hpss': 10, 'pitch': 2, 'assignment': 0.5, 'export': 2}
+jobs.register('satb_generate', generate_job, stages=tuple(GENERATE_STAGES), weights=GENERATE_STAGES)
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = jobs.status(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job['result']:
+        with_download_urls(job['result'])
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    # Server-Sent Events: stage progress with percentage and ETA, and each output file as it is written
+    return Response(jobs.events(job_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/results/<path:filename>')
 def download_file(filename):
-    return send_from_directory(app.config['RESULTS_FOLDER'], filename, as_attachment=True)
+    # Cacheable, range-capable responses; MusicXML goes out precompressed
+    return send_result(app.config['RESULTS_FOLDER'], filename, as_attachment=True)
 
 if __name__ == '__main__':
     app.run(debug=True)